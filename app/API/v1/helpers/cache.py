@@ -0,0 +1,91 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """
+    Cache en memoria con expiración por entrada y desalojo LRU al
+    superar `max_size`. Es seguro para usarse desde varios hilos.
+
+    Con `stale_ttl` las entradas vencidas se conservan ese tiempo extra
+    para poder servirse mientras se revalidan (`lookup`).
+    """
+
+    def __init__(self, ttl: float, max_size: int = 1024, stale_ttl: float = 0):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._items = OrderedDict()
+        self._lock = Lock()
+
+    def lookup(self, key: Hashable) -> Optional[Tuple[Any, bool]]:
+        """
+        Retorna `(valor, vigente)` o None si la entrada no existe o ya no
+        puede servirse
+        """
+        now = time.monotonic()
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[2] <= now:
+                if item is not None:
+                    del self._items[key]
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            fresh = item[1] > now
+            if fresh:
+                self.hits += 1
+            else:
+                self.stale_hits += 1
+            return item[0], fresh
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[1] <= now:
+                if item is not None and item[2] <= now:
+                    del self._items[key]
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        fresh_until = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._items[key] = (value, fresh_until, fresh_until + self.stale_ttl)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._items.pop(key, None)
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]) -> None:
+        with self._lock:
+            for key in [key for key in self._items if predicate(key)]:
+                del self._items[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.stale_hits + self.misses
+        return {"size": len(self._items),
+                "maxSize": self.max_size,
+                "hits": self.hits,
+                "staleHits": self.stale_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hitRate": round((self.hits + self.stale_hits) / total, 4) if total else 0.0}
@@ -1,10 +1,28 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import wraps
+from threading import Lock
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+from starlette.concurrency import run_in_threadpool
 from starlette.requests import Request
-import urllib3
+import asyncio
+import hashlib
 import json
 from fastapi.exceptions import HTTPException
-from app.settings import SERVICES
+from app.settings import SERVICES, SERVICES_TIMEOUT, SERVICES_CONCURRENCY, USERS_BULK_ENDPOINT, REFERENCE_CACHE, REFERENCE_CACHE_SHARED
+from .cache import TTLCache
+from .http_client import http
 
-http = urllib3.PoolManager()
+reference_caches = {namespace: TTLCache(**config)
+                    for namespace, config in REFERENCE_CACHE.items()}
+
+revalidation_pool = ThreadPoolExecutor(max_workers=4)
+downstream_pool = ThreadPoolExecutor(max_workers=SERVICES_CONCURRENCY)
+revalidating = set()
+revalidating_lock = Lock()
+
+in_flight = {}
+in_flight_lock = Lock()
+flight_stats = {"requests": 0, "coalesced": 0}
 
 
 def handle_response(result) -> object:
@@ -13,29 +31,185 @@ def handle_response(result) -> object:
     raise HTTPException(status_code=400, detail="Error al obtener datos")
 
 
+def single_flight(key: Hashable, func: Callable):
+    """
+    Si ya hay una llamada en curso con la misma llave se espera su
+    resultado en vez de repetir la consulta
+    """
+    with in_flight_lock:
+        future = in_flight.get(key)
+        leader = future is None
+        if leader:
+            future = Future()
+            in_flight[key] = future
+            flight_stats["requests"] += 1
+        else:
+            flight_stats["coalesced"] += 1
+
+    if not leader:
+        return future.result()
+
+    try:
+        result = func()
+        future.set_result(result)
+        return result
+    except Exception as error:
+        future.set_exception(error)
+        raise
+    finally:
+        with in_flight_lock:
+            del in_flight[key]
+
+
+def get_flight_stats() -> dict:
+    return {**flight_stats, "inFlight": len(in_flight)}
+
+
+def revalidate(namespace: str, key: Hashable, loader: Callable) -> None:
+    with revalidating_lock:
+        if (namespace, key) in revalidating:
+            return
+        revalidating.add((namespace, key))
+
+    def refresh():
+        try:
+            reference_caches[namespace].set(key, loader())
+        except Exception:
+            pass
+        finally:
+            with revalidating_lock:
+                revalidating.discard((namespace, key))
+
+    revalidation_pool.submit(refresh)
+
+
+def cached_fetch(namespace: str, key: Hashable, loader: Callable):
+    """
+    Retorna el dato desde el cache del namespace. Si la entrada está
+    vencida pero dentro de su ventana `stale_ttl` se retorna igual y se
+    actualiza en segundo plano.
+    """
+    cache = reference_caches[namespace]
+    entry = cache.lookup(key)
+    if entry is not None:
+        value, fresh = entry
+        if not fresh:
+            revalidate(namespace, key, loader)
+        return value
+
+    value = loader()
+    cache.set(key, value)
+    return value
+
+
+def get_cache_scope(namespace: str, req: Request) -> Optional[Hashable]:
+    """
+    Usuario dueño de las entradas del namespace, None si se comparten.
+    Los servicios responden según el token, así un usuario no recibe
+    datos que se obtuvieron con los permisos de otro.
+    """
+    if namespace in REFERENCE_CACHE_SHARED:
+        return None
+    auth = getattr(req.state, "auth", None)
+    return auth.user_id if auth else None
+
+
+def reference_data(namespace: str):
+    """
+    Cachea un helper de la forma `helper(req, *args)` usando el usuario
+    (ver `get_cache_scope`) y `args` como llave
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(req: Request, *args):
+            return cached_fetch(namespace, (get_cache_scope(namespace, req), *args), lambda: func(req, *args))
+        return wrapper
+    return decorator
+
+
+def invalidate_reference_data(namespace: str, key: Optional[Hashable] = None) -> None:
+    """
+    Invalida las entradas de `key` de todos los usuarios, o el namespace
+    completo si se omite
+    """
+    if key is None:
+        reference_caches[namespace].clear()
+    else:
+        reference_caches[namespace].invalidate_where(lambda item: item[1:] == key)
+
+
+def get_cache_stats() -> dict:
+    return {namespace: cache.stats() for namespace, cache in reference_caches.items()}
+
+
+@reference_data("parameters")
 def fetch_parameter_data(req: Request, endpoint: str, id: int) -> object:
-    response = http.request(
-        'GET', SERVICES["parameters"]+'/'+endpoint+'/'+str(id), headers={
-            "Authorization": "Bearer %s" % req.token
-        })
+    return fetch_service(req.token, SERVICES["parameters"] + '/' + endpoint + '/' + str(id))
+
 
-    return handle_response(response)
+def format_user(user: dict) -> dict:
+    return {**user,
+            "paternalSurname": user["paternal_surname"],
+            "maternalSurname": user["maternal_surname"]}
 
+
+@reference_data("users")
 def fetch_users_service(req: Request, user_id: int) -> str:
-    user_req = http.request(
-        'GET', SERVICES["users"]+'/users/' + str(user_id), headers={
-            "Authorization": "Bearer %s" % req.token
-        })
-    result = handle_response(user_req)
+    result = fetch_service(req.token, SERVICES["users"] + '/users/' + str(user_id))
+
+    return format_user(result[0])
+
+
+def fetch_users_bulk(req: Request, user_ids: List[int]) -> List[dict]:
+    route = SERVICES["users"] + USERS_BULK_ENDPOINT + "?ids=" + ",".join(str(i) for i in user_ids)
+    result = fetch_service(req.token, route)
+
+    return [format_user(user) for user in result]
+
+
+def fetch_users_batch(req: Request, user_ids: Iterable[int]) -> Dict[int, dict]:
+    """
+    Obtiene varios usuarios sin repetir ids. Usa la consulta masiva del
+    servicio de usuarios si está configurada y, si no, consultas
+    individuales en paralelo limitadas por SERVICES_CONCURRENCY.
+    """
+    ids = list(dict.fromkeys(user_ids))
+    users = {}
+
+    if USERS_BULK_ENDPOINT:
+        cache = reference_caches["users"]
+        scope = get_cache_scope("users", req)
+        for user_id in ids:
+            user = cache.get((scope, user_id))
+            if user is not None:
+                users[user_id] = user
+        missing = [user_id for user_id in ids if user_id not in users]
+        if missing:
+            try:
+                for user in fetch_users_bulk(req, missing):
+                    cache.set((scope, user["id"]), user)
+                    users[user["id"]] = user
+            except HTTPException:
+                pass
+
+    missing = [user_id for user_id in ids if user_id not in users]
+    users.update(fetch_batch(req, fetch_users_service, missing))
+    return users
+
 
-    return {**result[0],
-            "paternalSurname": result[0]["paternal_surname"],
-            "maternalSurname": result[0]["maternal_surname"]}
+def fetch_batch(req: Request, helper: Callable, ids: Iterable[int]) -> Dict[int, object]:
+    """
+    Ejecuta `helper(req, id)` una vez por id distinto, en paralelo y
+    limitado por SERVICES_CONCURRENCY
+    """
+    ids = list(dict.fromkeys(ids))
+
+    return dict(zip(ids, downstream_pool.map(lambda i: helper(req, i), ids)))
 
 
 def post_course_module(token: str, body) -> str:
     user_req = http.request(
-        'POST', SERVICES["courses"]+'/courses', headers={
+        'POST', SERVICES["courses"] + '/courses', headers={
             "Authorization": "Bearer %s" % token
         }, body=json.dumps(body))
     result = handle_response(user_req)
@@ -44,28 +218,34 @@ def post_course_module(token: str, body) -> str:
 
 
 def fetch_service(token: str, route: str) -> str:
-    user_req = http.request(
-        'GET', route, headers={
-            "Authorization": "Bearer %s" % token
-        })
-    result = handle_response(user_req)
+    def request():
+        user_req = http.request(
+            'GET', route, headers={
+                "Authorization": "Bearer %s" % token
+            })
+        return handle_response(user_req)
 
-    return result
+    return single_flight((route, hashlib.sha256(token.encode()).hexdigest()), request)
 
 
+@reference_data("business")
 def get_business_data(request: Request, id: int):
-    return fetch_service(request.token, SERVICES["business"] + "/business/"+str(id))
+    return fetch_service(request.token, SERVICES["business"] + "/business/" + str(id))
 
 
+@reference_data("employees")
 def get_employee_data(request: Request, id: int):
-    return fetch_service(request.token, SERVICES["employees"] + "/employees/"+str(id))
+    return fetch_service(request.token, SERVICES["employees"] + "/employees/" + str(id))
+
 
+@reference_data("assistance")
 def get_assistance_information(request: Request, id: int):
-    return fetch_service(request.token, SERVICES["assistance"] + "/assistance/"+str(id))
+    return fetch_service(request.token, SERVICES["assistance"] + "/assistance/" + str(id))
+
 
 def delete_file_from_store(file_key: str):
     user_req = http.request(
-        'DELETE', SERVICES["parameters"]+"/file/delete/"+file_key)
+        'DELETE', SERVICES["parameters"] + "/file/delete/" + file_key)
     result = handle_response(user_req)
 
     return result
@@ -79,3 +259,37 @@ def handle_request(token: str, route: str, body, method: str = "GET",) -> str:
 
     result = handle_response(user_req)
     return result
+
+
+async def fetch_async(func: Callable, *args, timeout: float = SERVICES_TIMEOUT):
+    """
+    Ejecuta un helper bloqueante en el threadpool con tiempo máximo de espera
+    """
+    try:
+        return await asyncio.wait_for(run_in_threadpool(func, *args), timeout)
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=504, detail="Tiempo de espera agotado al obtener datos")
+
+
+async def fetch_concurrently(calls: Dict[str, Tuple], optional: Iterable[str] = (),
+                             timeouts: Optional[Dict[str, float]] = None) -> dict:
+    """
+    Ejecuta en paralelo llamadas de la forma `{nombre: (helper, *args)}`.
+    Las llamadas en `optional` retornan None si fallan en vez de cortar
+    la respuesta completa.
+    """
+    timeouts = timeouts or {}
+    names = list(calls)
+    results = await asyncio.gather(
+        *[fetch_async(*calls[name], timeout=timeouts.get(name, SERVICES_TIMEOUT)) for name in names],
+        return_exceptions=True)
+
+    data = {}
+    for name, result in zip(names, results):
+        if isinstance(result, Exception):
+            if name not in optional:
+                raise result
+            result = None
+        data[name] = result
+    return data
@@ -0,0 +1,66 @@
+from datetime import date, datetime, timedelta
+from typing import Optional, Union
+from sqlalchemy.sql import true
+from sqlalchemy.sql.elements import and_, or_
+from sqlalchemy.sql.functions import func
+from app.settings import FILTER_TIMEZONE
+from .search import search_condition
+
+
+def get_day_start(value: Union[date, datetime]) -> datetime:
+    return datetime(value.year, value.month, value.day)
+
+
+class FilterSet:
+    """
+    Arma la condición de los filtros de una lista. Cada filtro restringe
+    el resultado (AND), los filtros omitidos (None) no se aplican. Las
+    condiciones se escriben sobre la columna sin transformar para que
+    Postgres pueda usar sus índices.
+    """
+
+    def __init__(self):
+        self.conditions = []
+        self.rank = None
+
+    def add(self, *conditions) -> "FilterSet":
+        self.conditions.extend(conditions)
+        return self
+
+    def equals(self, column, value) -> "FilterSet":
+        if value is not None:
+            self.conditions.append(column == value)
+        return self
+
+    def any_of(self, value, *conditions) -> "FilterSet":
+        """
+        Agrega un OR de `conditions` cuando el filtro `value` viene
+        informado
+        """
+        if value is not None:
+            self.conditions.append(or_(*conditions))
+        return self
+
+    def date_range(self, column, start: Optional[datetime], end: Optional[datetime],
+                   timezone: str = FILTER_TIMEZONE) -> "FilterSet":
+        """
+        Filtra los días de `start` a `end` (ambos inclusive) como el rango
+        semiabierto [inicio de start, inicio del día siguiente a end) en
+        la zona horaria `timezone`. La hora y el offset de los parámetros
+        se ignoran, igual que al comparar por fecha.
+        """
+        if start:
+            self.conditions.append(column >= func.timezone(timezone, get_day_start(start)))
+        if end:
+            self.conditions.append(column < func.timezone(timezone, get_day_start(end) + timedelta(days=1)))
+        return self
+
+    def search(self, vector_column, search: Optional[str]) -> "FilterSet":
+        result = search_condition(vector_column, search) if search else None
+        if result is not None:
+            condition, self.rank = result
+            self.conditions.append(condition)
+        return self
+
+    def condition(self):
+        return and_(*self.conditions) if self.conditions else true()
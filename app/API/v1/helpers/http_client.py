@@ -0,0 +1,184 @@
+import random
+import time
+from collections import deque
+from threading import Lock
+import urllib3
+from urllib3.exceptions import HTTPError
+from fastapi.exceptions import HTTPException
+from app.settings import SERVICES, SERVICES_CONFIG, SERVICES_POOL_SIZE, RETRY_BUDGET_RATIO, RETRY_BACKOFF
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+# El servicio de usuarios responde 500 ante tokens mal formados, por eso
+# solo se consideran caídas los errores de gateway
+UNAVAILABLE_STATUS = {502, 503, 504}
+
+# Los reintentos se controlan aquí, urllib3 solo sigue redirecciones
+NO_RETRIES = urllib3.Retry(total=None, connect=0, read=0, status=0, other=0, redirect=3)
+
+DEFAULT_CONFIG = {"connect_timeout": 1.0, "read_timeout": 3.0, "retries": 0,
+                  "failure_threshold": 5, "reset_timeout": 30.0}
+
+
+class CircuitBreaker:
+    """
+    Abre el circuito tras `failure_threshold` fallas seguidas. Mientras
+    está abierto las llamadas fallan de inmediato; pasado `reset_timeout`
+    deja pasar una llamada de prueba (semi-abierto).
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "CLOSED"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "CLOSED":
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "HALF_OPEN"
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "CLOSED"
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == "HALF_OPEN" or self.failures >= self.failure_threshold:
+                self.state = "OPEN"
+                self.opened_at = time.monotonic()
+
+
+class ServiceStats:
+    def __init__(self, window: int = 500):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.rejected = 0
+        self.retry_tokens = 10.0
+        self.latencies = deque(maxlen=window)
+        self._lock = Lock()
+
+    def record(self, latency: float, failed: bool) -> None:
+        with self._lock:
+            self.requests += 1
+            self.latencies.append(latency)
+            if failed:
+                self.errors += 1
+            else:
+                self.retry_tokens = min(self.retry_tokens + RETRY_BUDGET_RATIO, 10.0)
+
+    def record_rejected(self) -> None:
+        with self._lock:
+            self.rejected += 1
+
+    def take_retry(self) -> bool:
+        with self._lock:
+            if self.retry_tokens < 1:
+                return False
+            self.retry_tokens -= 1
+            self.retries += 1
+            return True
+
+    def percentile(self, values: list, p: float) -> float:
+        if not values:
+            return 0.0
+        return round(values[min(len(values) - 1, int(len(values) * p))] * 1000, 2)
+
+    def as_dict(self) -> dict:
+        values = sorted(self.latencies)
+        return {"requests": self.requests,
+                "errors": self.errors,
+                "retries": self.retries,
+                "rejected": self.rejected,
+                "p50Ms": self.percentile(values, 0.5),
+                "p95Ms": self.percentile(values, 0.95),
+                "p99Ms": self.percentile(values, 0.99)}
+
+
+class ServiceClient:
+    """
+    Reemplazo de `urllib3.PoolManager().request` con timeouts por servicio,
+    reintentos acotados con jitter y circuit breaker
+    """
+
+    def __init__(self, pool_size: int = SERVICES_POOL_SIZE):
+        self.pool = urllib3.PoolManager(num_pools=len(SERVICES) + 2, maxsize=pool_size)
+        self.configs = {**SERVICES_CONFIG, "other": DEFAULT_CONFIG}
+        self.breakers = {}
+        self.stats = {}
+        # Prefijos más largos primero para resolver el servicio de una url
+        self.prefixes = sorted(SERVICES.items(), key=lambda item: -len(item[1]))
+
+    def get_service(self, url: str) -> str:
+        for service, prefix in self.prefixes:
+            if url.startswith(prefix):
+                return service
+        return "other"
+
+    def get_breaker(self, service: str) -> CircuitBreaker:
+        if service not in self.breakers:
+            config = self.configs[service]
+            self.breakers.setdefault(service, CircuitBreaker(
+                config["failure_threshold"], config["reset_timeout"]))
+        return self.breakers[service]
+
+    def get_stats(self, service: str) -> ServiceStats:
+        if service not in self.stats:
+            self.stats.setdefault(service, ServiceStats())
+        return self.stats[service]
+
+    def request(self, method: str, url: str, **kwargs):
+        service = self.get_service(url)
+        config = self.configs[service]
+        breaker = self.get_breaker(service)
+        stats = self.get_stats(service)
+        timeout = urllib3.Timeout(connect=config["connect_timeout"], read=config["read_timeout"])
+        retries = config["retries"] if method.upper() in IDEMPOTENT_METHODS else 0
+
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                stats.record_rejected()
+                raise HTTPException(
+                    status_code=503, detail="Servicio no disponible: %s" % service)
+
+            started = time.monotonic()
+            try:
+                response = self.pool.request(
+                    method, url, timeout=timeout, retries=NO_RETRIES, **kwargs)
+                failed = response.status in UNAVAILABLE_STATUS
+            except HTTPError:
+                response = None
+                failed = True
+            stats.record(time.monotonic() - started, failed)
+
+            if not failed:
+                breaker.record_success()
+                return response
+
+            breaker.record_failure()
+            if attempt >= retries or not stats.take_retry():
+                if response is not None:
+                    return response
+                raise HTTPException(
+                    status_code=503, detail="Error al conectar con servicio: %s" % service)
+
+            attempt += 1
+            time.sleep(random.uniform(0, RETRY_BACKOFF * 2 ** attempt))
+
+    def as_dict(self) -> dict:
+        return {service: {**stats.as_dict(), "breaker": self.get_breaker(service).state}
+                for service, stats in self.stats.items()}
+
+
+http = ServiceClient()
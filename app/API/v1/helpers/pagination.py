@@ -0,0 +1,181 @@
+import base64
+import hashlib
+import json
+from datetime import datetime
+from typing import Generic, Iterable, Optional, Sequence, Tuple, Type, TypeVar
+from fastapi.exceptions import HTTPException
+from fastapi.responses import JSONResponse
+from fastapi_pagination import Page, Params
+from fastapi_pagination.ext.sqlalchemy import paginate_query
+from pydantic import BaseModel, Field
+from pydantic.generics import GenericModel
+from sqlalchemy.orm import Query
+from sqlalchemy.sql.elements import or_
+from app.settings import COUNT_CACHE_TTL, COUNT_CACHE_SIZE, COUNT_ESTIMATE_THRESHOLD
+from .cache import TTLCache
+
+T = TypeVar("T")
+
+COUNT_MODES = "^(exact|cached|estimated)$"
+
+count_cache = TTLCache(ttl=COUNT_CACHE_TTL, max_size=COUNT_CACHE_SIZE)
+
+PAGE_ALIASES = {"exact_total": "exactTotal", "next_cursor": "nextCursor"}
+
+
+class CountedPage(Page[T], Generic[T]):
+    exact_total: bool = Field(True, alias="exactTotal")
+
+    class Config:
+        allow_population_by_field_name = True
+
+
+class CursorPage(GenericModel, Generic[T]):
+    items: Sequence[T]
+    size: int
+    next_cursor: Optional[str] = Field(alias="nextCursor")
+
+    class Config:
+        allow_population_by_field_name = True
+
+
+def encode_cursor(created_at: datetime, id: int) -> str:
+    value = json.dumps([created_at.isoformat(), id]).encode()
+    return base64.urlsafe_b64encode(value).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        created_at, id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(created_at), int(id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
+def paginate_cursor(query: Query, created_at_column, id_column, cursor: Optional[str],
+                    size: int, descending: bool = True) -> dict:
+    """
+    Paginación por llave (created_at, id). Cada página cuesta lo mismo sin
+    importar su profundidad porque no usa OFFSET ni COUNT.
+    """
+    if cursor:
+        created_at, id = decode_cursor(cursor)
+        # La primera condición es la que usa el índice sobre created_at
+        if descending:
+            query = query.filter(created_at_column <= created_at,
+                                 or_(created_at_column < created_at, id_column < id))
+        else:
+            query = query.filter(created_at_column >= created_at,
+                                 or_(created_at_column > created_at, id_column > id))
+
+    if descending:
+        query = query.order_by(created_at_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(created_at_column, id_column)
+
+    items = query.limit(size + 1).all()
+    next_cursor = None
+    if len(items) > size:
+        items = items[:size]
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, created_at_column.key), getattr(last, id_column.key))
+
+    return {"items": items, "size": size, "next_cursor": next_cursor}
+
+
+def compile_query(query: Query):
+    """
+    Compila la consulta con los parámetros IN expandidos, uno por valor,
+    para poder ejecutarla fuera del ORM
+    """
+    return query.statement.compile(dialect=query.session.bind.dialect,
+                                   compile_kwargs={"render_postcompile": True})
+
+
+def estimate_count(query: Query) -> int:
+    """
+    Filas estimadas por el planner para la consulta, sin ejecutarla
+    """
+    compiled = compile_query(query)
+    plan = query.session.connection().exec_driver_sql(
+        "EXPLAIN (FORMAT JSON) " + str(compiled), compiled.params).scalar()
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def get_query_signature(query: Query) -> str:
+    compiled = compile_query(query)
+    params = json.dumps(compiled.params, default=str, sort_keys=True)
+    return hashlib.sha256((str(compiled) + params).encode()).hexdigest()
+
+
+def count_query(query: Query, mode: str) -> Tuple[int, bool]:
+    """
+    Retorna `(total, exacto)` según la estrategia:
+    - exact: COUNT(*) en cada llamada
+    - cached: COUNT(*) reutilizado por firma de filtros durante COUNT_CACHE_TTL
+    - estimated: estimación del planner, con COUNT(*) si es menor a
+      COUNT_ESTIMATE_THRESHOLD
+    """
+    query = query.order_by(None)
+    if mode == "estimated":
+        estimate = estimate_count(query)
+        if estimate >= COUNT_ESTIMATE_THRESHOLD:
+            return estimate, False
+    elif mode == "cached":
+        signature = get_query_signature(query)
+        total = count_cache.get(signature)
+        if total is not None:
+            return total, False
+        total = query.count()
+        count_cache.set(signature, total)
+        return total, True
+
+    return query.count(), True
+
+
+def paginate_counted(query: Query, params: Params, mode: str) -> dict:
+    total, exact = count_query(query, mode)
+
+    return {"items": paginate_query(query, params).all(),
+            "total": total,
+            "page": params.page,
+            "size": params.size,
+            "exact_total": exact}
+
+
+class Projection:
+    """
+    Columnas del modelo que necesita un schema de respuesta. Las filas se
+    convierten directo a dicts con los alias del schema, sin objetos ORM
+    ni validación de pydantic.
+    """
+
+    def __init__(self, model, schema: Type[BaseModel]):
+        fields = [field for field in schema.__fields__.values() if field.name in model.__table__.columns]
+        self.columns = [getattr(model, field.name) for field in fields]
+        self.aliases = [field.alias for field in fields]
+
+    def serialize(self, rows: Iterable) -> list:
+        return [dict(zip(self.aliases, row)) for row in rows]
+
+
+def encode_json_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError("Tipo no serializable: %s" % type(value).__name__)
+
+
+class ProjectionResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":"),
+                          default=encode_json_value).encode("utf-8")
+
+
+def projection_response(projection: Projection, page: dict) -> ProjectionResponse:
+    """
+    Respuesta de una página de `paginate_counted` o `paginate_cursor`
+    hecha con las columnas de `projection`
+    """
+    content = {PAGE_ALIASES.get(key, key): value for key, value in page.items()}
+    content["items"] = projection.serialize(page["items"])
+    return ProjectionResponse(content)
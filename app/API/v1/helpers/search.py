@@ -0,0 +1,39 @@
+import re
+from typing import Optional
+from sqlalchemy.sql.functions import func
+
+SEARCH_CONFIG = "es_unaccent"
+
+# Se considera RUT si solo contiene dígitos, puntos, guion y K
+RUT_PATTERN = re.compile(r"^[0-9.\-kK]+$")
+
+
+def normalize_rut(value: str) -> str:
+    return re.sub(r"[^0-9K]", "", value.upper())
+
+
+def is_rut(value: str) -> bool:
+    return bool(RUT_PATTERN.match(value.strip())) and any(c.isdigit() for c in value)
+
+
+def build_tsquery(search: str) -> Optional[str]:
+    """
+    Convierte el texto de búsqueda en un tsquery de prefijos, ej:
+    "juan pér" -> "juan:* & pér:*"
+    """
+    terms = re.findall(r"\w+", search)
+    if not terms:
+        return None
+    return " & ".join("%s:*" % term for term in terms)
+
+
+def search_condition(vector_column, search: str) -> Optional[tuple]:
+    """
+    Retorna `(filtro, ranking)` de búsqueda de texto completo sobre la
+    columna tsvector, o None si el texto no tiene palabras que buscar
+    """
+    query = build_tsquery(search)
+    if query is None:
+        return None
+    tsquery = func.to_tsquery(SEARCH_CONFIG, query)
+    return vector_column.op("@@")(tsquery), func.ts_rank(vector_column, tsquery)
@@ -1,30 +1,97 @@
+import hashlib
 import json
+import time
 from fastapi import Request, HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from urllib3 import PoolManager, util
-from app.settings import SERVICES
+from starlette.concurrency import run_in_threadpool
+from app.settings import SERVICES, JWT_USER_CLAIM, AUTH_REMOTE_FALLBACK, AUTH_CACHE_TTL, AUTH_CACHE_SIZE
+from ..helpers.cache import TTLCache
+from ..helpers.http_client import http
+from .token import InvalidToken, UnverifiableToken, decode_jwt, get_payload
 
-http = PoolManager()
+token_cache = TTLCache(ttl=AUTH_CACHE_TTL, max_size=AUTH_CACHE_SIZE)
+
+auth_stats = {"local": 0, "remote": 0, "rejected": 0}
+
+
+def get_auth_stats() -> dict:
+    return {**token_cache.stats(), **auth_stats}
+
+
+def get_cache_ttl(payload: dict) -> float:
+    if "exp" not in payload:
+        return AUTH_CACHE_TTL
+    try:
+        return min(AUTH_CACHE_TTL, float(payload["exp"]) - time.time())
+    except (TypeError, ValueError):
+        return 0
+
+
+class AuthContext:
+    def __init__(self, user_id: int, token: str):
+        self.user_id = user_id
+        self.token = token
 
 
 class JWTBearer(HTTPBearer):
     def __init__(self, auto_error: bool = True):
         super(JWTBearer, self).__init__(auto_error=auto_error)
 
-    async def __call__(self, request: Request):
+    async def __call__(self, request: Request) -> AuthContext:
+        # JWTBearer se declara en el router principal y en cada módulo,
+        # el usuario se resuelve una sola vez por request
+        context = getattr(request.state, "auth", None)
+        if context is None:
+            context = await self.resolve_context(request)
+            request.state.auth = context
+
+        request.user_id = context.user_id
+        request.token = context.token
+        return context
+
+    async def resolve_context(self, request: Request) -> AuthContext:
         credentials: HTTPAuthorizationCredentials = await super(JWTBearer, self).__call__(request)
         if credentials:
             if not credentials.scheme == "Bearer":
                 raise HTTPException(
                     status_code=403, detail="Formato de token inválido")
-            user_id = self.verify_jwt(credentials.credentials)
-            request.user_id = user_id
-            request.token = credentials.credentials
+            user_id = await self.authenticate(credentials.credentials)
+            return AuthContext(user_id, credentials.credentials)
 
         else:
             raise HTTPException(
                 status_code=403, detail="Authorización inválida")
 
+    async def authenticate(self, jwtoken: str) -> int:
+        key = hashlib.sha256(jwtoken.encode()).hexdigest()
+        user_id = token_cache.get(key)
+        if user_id is not None:
+            return user_id
+
+        try:
+            payload = decode_jwt(jwtoken)
+            user_id = int(payload[JWT_USER_CLAIM])
+            auth_stats["local"] += 1
+        except InvalidToken as error:
+            auth_stats["rejected"] += 1
+            raise HTTPException(status_code=403, detail=str(error))
+        except (UnverifiableToken, KeyError, TypeError, ValueError):
+            if not AUTH_REMOTE_FALLBACK:
+                auth_stats["rejected"] += 1
+                raise HTTPException(
+                    status_code=403, detail="Token inválido o expirado")
+            user_id = await run_in_threadpool(self.verify_jwt, jwtoken)
+            auth_stats["remote"] += 1
+            try:
+                payload = get_payload(jwtoken)
+            except (InvalidToken, UnverifiableToken):
+                payload = {}
+
+        ttl = get_cache_ttl(payload)
+        if ttl > 0:
+            token_cache.set(key, user_id, ttl)
+        return user_id
+
     def verify_jwt(self, jwtoken: str) -> int:
 
         user_req = http.request(
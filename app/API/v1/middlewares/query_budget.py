@@ -0,0 +1,171 @@
+import logging
+import time
+from collections import Counter
+from contextvars import ContextVar
+from threading import Lock
+from typing import Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app.settings import QUERY_BUDGET_MODE, QUERY_BUDGET_STATEMENTS, QUERY_BUDGET_REPEATED
+
+logger = logging.getLogger(__name__)
+
+current_stats: ContextVar = ContextVar("query_stats", default=None)
+
+budget_stats = {}
+budget_stats_lock = Lock()
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryStats:
+    """
+    Sentencias y tiempo de base de datos de un request. Se comparte entre
+    el event loop y los hilos del threadpool, que copian el contexto pero
+    apuntan al mismo objeto.
+    """
+
+    def __init__(self):
+        self.statements = 0
+        self.time = 0.0
+        self.repeated = Counter()
+        self.max_statements = QUERY_BUDGET_STATEMENTS
+        self.max_repeated = QUERY_BUDGET_REPEATED
+        self.active = True
+
+    def most_repeated(self):
+        return self.repeated.most_common(1)[0] if self.repeated else (None, 0)
+
+    def violations(self, statements: int, repeated: int) -> list:
+        result = []
+        if self.max_statements is not None and statements > self.max_statements:
+            result.append("%s sentencias (máximo %s)" % (statements, self.max_statements))
+        if self.max_repeated is not None and repeated > self.max_repeated:
+            result.append("sentencia repetida %s veces (máximo %s)" % (repeated, self.max_repeated))
+        return result
+
+
+class QueryBudget:
+    """
+    Dependencia que declara el presupuesto de consultas de un endpoint:
+
+        @router.get("/{id}", dependencies=[Depends(QueryBudget(statements=2))])
+
+    None desactiva el límite correspondiente.
+    """
+
+    def __init__(self, statements: Optional[int] = QUERY_BUDGET_STATEMENTS,
+                 repeated: Optional[int] = QUERY_BUDGET_REPEATED):
+        self.statements = statements
+        self.repeated = repeated
+
+    async def __call__(self):
+        stats = current_stats.get()
+        if stats is not None:
+            stats.max_statements = self.statements
+            stats.max_repeated = self.repeated
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_stats.get()
+    if stats is None or not stats.active:
+        return
+
+    stats.statements += 1
+    stats.repeated[statement] += 1
+    if QUERY_BUDGET_MODE == "raise":
+        # Se corta en la sentencia que excede el presupuesto para que la
+        # traza apunte al código que la origina
+        errors = stats.violations(stats.statements, stats.repeated[statement])
+        if errors:
+            raise QueryBudgetExceeded("%s: %s" % (", ".join(errors), statement))
+
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_stats.get()
+    if stats is None or not stats.active or not conn.info.get("query_start_time"):
+        return
+    stats.time += time.perf_counter() - conn.info["query_start_time"].pop()
+
+
+@event.listens_for(Engine, "handle_error")
+def handle_error(context):
+    if context.connection is not None and context.connection.info.get("query_start_time"):
+        context.connection.info["query_start_time"].pop()
+
+
+def get_endpoint_name(scope: dict) -> str:
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return "%s %s" % (scope["method"], scope["path"])
+    # app.API.v1.modules.social_cases.routes -> social_cases
+    module = endpoint.__module__.split(".")
+    return "%s %s.%s" % (scope["method"], module[-2] if len(module) > 1 else module[0], endpoint.__name__)
+
+
+def record_request(scope: dict, stats: QueryStats):
+    statement, repeated = stats.most_repeated()
+    errors = stats.violations(stats.statements, repeated)
+    name = get_endpoint_name(scope)
+
+    with budget_stats_lock:
+        item = budget_stats.setdefault(name, {"requests": 0, "statements": 0, "time": 0.0,
+                                              "maxStatements": 0, "exceeded": 0})
+        item["requests"] += 1
+        item["statements"] += stats.statements
+        item["time"] += stats.time
+        item["maxStatements"] = max(item["maxStatements"], stats.statements)
+        item["exceeded"] += bool(errors)
+
+    if errors and QUERY_BUDGET_MODE == "log":
+        logger.warning("Presupuesto de consultas excedido en %s %s: %s, %.1f ms", scope["method"], scope["path"],
+                       ", ".join(errors), stats.time * 1000)
+        if repeated > 1:
+            logger.warning("Sentencia más repetida: %s", " ".join(statement.split())[:500])
+
+
+def get_budget_stats() -> dict:
+    with budget_stats_lock:
+        return {name: {**item, "time": round(item["time"] * 1000, 1)} for name, item in budget_stats.items()}
+
+
+class QueryBudgetMiddleware:
+    """
+    Cuenta las sentencias y el tiempo de base de datos de cada request y
+    los informa en los headers `X-DB-Statements` y `X-DB-Time`. Las tareas
+    en segundo plano que corren después de la respuesta no se cuentan.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = QueryStats()
+        token = current_stats.set(stats)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []),
+                                      (b"x-db-statements", str(stats.statements).encode()),
+                                      (b"x-db-time", ("%.1f" % (stats.time * 1000)).encode())]
+            elif message["type"] == "http.response.body" and not message.get("more_body", False) and stats.active:
+                stats.active = False
+                record_request(scope, stats)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if stats.active:
+                stats.active = False
+                record_request(scope, stats)
+            current_stats.reset(token)
@@ -0,0 +1,80 @@
+import base64
+import hashlib
+import hmac
+import json
+import time
+from app.settings import JWT_SECRET_KEY, JWT_KEYS, JWT_ALGORITHMS
+
+HMAC_ALGORITHMS = {
+    "HS256": hashlib.sha256,
+    "HS384": hashlib.sha384,
+    "HS512": hashlib.sha512,
+}
+
+
+class InvalidToken(Exception):
+    pass
+
+
+class UnverifiableToken(Exception):
+    pass
+
+
+def get_keys() -> dict:
+    keys = json.loads(JWT_KEYS) if JWT_KEYS else {}
+    if JWT_SECRET_KEY:
+        keys[None] = JWT_SECRET_KEY
+    return {kid: secret.encode() for kid, secret in keys.items()}
+
+
+KEYS = get_keys()
+
+
+def b64decode(value: str) -> bytes:
+    return base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+
+
+def decode_segment(segment: str) -> dict:
+    value = json.loads(b64decode(segment))
+    if not isinstance(value, dict):
+        raise UnverifiableToken("El segmento del token no es un objeto")
+    return value
+
+
+def get_payload(token: str) -> dict:
+    """
+    Lee el payload del token sin verificar la firma
+    """
+    try:
+        return decode_segment(token.split(".")[1])
+    except (IndexError, ValueError):
+        raise InvalidToken("Formato de token inválido")
+
+
+def decode_jwt(token: str) -> dict:
+    """
+    Verifica firma y expiración del token con las llaves configuradas.
+    Lanza `UnverifiableToken` si no hay llave o algoritmo para validarlo
+    localmente, o si el header o el payload no son objetos.
+    """
+    try:
+        header_segment, payload_segment, signature_segment = token.split(".")
+        header = decode_segment(header_segment)
+        signature = b64decode(signature_segment)
+    except ValueError:
+        raise InvalidToken("Formato de token inválido")
+
+    algorithm = header.get("alg")
+    key = KEYS.get(header.get("kid"), KEYS.get(None))
+    if algorithm not in HMAC_ALGORITHMS or algorithm not in JWT_ALGORITHMS or not key:
+        raise UnverifiableToken(algorithm)
+
+    signing_input = ("%s.%s" % (header_segment, payload_segment)).encode()
+    expected = hmac.new(key, signing_input, HMAC_ALGORITHMS[algorithm]).digest()
+    if not hmac.compare_digest(expected, signature):
+        raise InvalidToken("Token inválido o expirado")
+
+    payload = get_payload(token)
+    if "exp" in payload and float(payload["exp"]) <= time.time():
+        raise InvalidToken("Token inválido o expirado")
+    return payload
@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, String
+from sqlalchemy.sql.functions import func
+from sqlalchemy.sql.sqltypes import DateTime
+from app.database.base_class import Base
+
+
+class CaseStateCounter(Base):
+    """
+    Cantidad de casos sociales activos por empresa, área y estado. Se
+    actualiza en la misma transacción que cada cambio de estado; los casos
+    sin empresa se registran con business_id 0.
+    """
+    __tablename__ = "case_state_counters"
+    business_id = Column(Integer, primary_key=True)
+    area_id = Column(Integer, primary_key=True)
+    state = Column(String(25), primary_key=True)
+    count = Column(Integer, nullable=False, server_default="0")
+    update_at = Column(DateTime(timezone=True),
+                       onupdate=func.now(), server_default=func.now())
@@ -1,29 +1,92 @@
+from datetime import date
+from typing import Optional
 from sqlalchemy.sql.functions import func
 from fastapi import APIRouter
-from fastapi.param_functions import Depends
-from sqlalchemy.orm.session import Session
-from app.database.main import get_database
+from fastapi.param_functions import Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.database.main import get_async_read_database
 from ...middlewares.auth import JWTBearer
-from ..social_cases.model import SocialCase
+from ...middlewares.query_budget import QueryBudget
+from .model import CaseStateCounter
+from .services import get_timeseries
 
 router = APIRouter(prefix="/dashboard",
                    tags=["Dashboard"],
                    dependencies=[Depends(JWTBearer())])
 
+BREAKDOWNS = {"business": ("businessId", CaseStateCounter.business_id),
+              "area": ("areaId", CaseStateCounter.area_id)}
 
-@router.get("/stats")
-def get_stats(db: Session = Depends(get_database)):
 
-    result = []
-    total = db.query(func.count(SocialCase.id).label("total")).filter(
-        SocialCase.is_active == True).all()
+def format_stats(rows) -> list:
+    result = [{"label": "Total casos", "value": sum(i.value for i in rows)}]
 
-    result.append({"label": "Total casos", "value": total[0].total})
-
-    docs = db.query(func.count(SocialCase.id).label(
-        "value"), SocialCase.state.label("label")).group_by(SocialCase.state).all()
-
-    for i in docs:
+    for i in rows:
         result.append({"label": i.label, "value": i.value})
 
     return result
+
+
+@router.get("/stats", dependencies=[Depends(QueryBudget(statements=1))])
+async def get_stats(business_id: Optional[int] = None,
+                    area_id: Optional[int] = None,
+                    breakdown: Optional[str] = Query(None, regex="^(business|area)$"),
+                    db: AsyncSession = Depends(get_async_read_database)):
+    """
+    Retorna la cantidad de casos sociales activos por estado, leída de los
+    contadores precalculados
+    ---
+    - **business_id**: filtra por empresa
+    - **area_id**: filtra por área
+    - **breakdown**: business o area, agrupa el resultado por empresa o área
+    """
+    value = func.sum(CaseStateCounter.count).label("value")
+    query = select(CaseStateCounter.state.label("label"), value).filter(
+        CaseStateCounter.count > 0).group_by(CaseStateCounter.state).order_by(CaseStateCounter.state)
+
+    if business_id is not None:
+        query = query.filter(CaseStateCounter.business_id == business_id)
+    if area_id is not None:
+        query = query.filter(CaseStateCounter.area_id == area_id)
+
+    if not breakdown:
+        return format_stats((await db.execute(query)).all())
+
+    key, column = BREAKDOWNS[breakdown]
+    rows = (await db.execute(query.add_columns(column.label("group_id")).group_by(column))).all()
+
+    groups = {}
+    for i in rows:
+        groups.setdefault(i.group_id, []).append(i)
+
+    # business_id 0 agrupa los casos sin empresa
+    return [{key: None if breakdown == "business" and group_id == 0 else group_id,
+             "stats": format_stats(group_rows)}
+            for group_id, group_rows in sorted(groups.items())]
+
+
+@router.get("/timeseries", dependencies=[Depends(QueryBudget(statements=2))])
+async def get_cases_timeseries(interval: str = Query("day", regex="^(day|week|month)$"),
+                               start: Optional[date] = None,
+                               end: Optional[date] = None,
+                               business_id: Optional[int] = None,
+                               area_id: Optional[int] = None,
+                               professional_id: Optional[int] = None,
+                               db: AsyncSession = Depends(get_async_read_database)):
+    """
+    Retorna la cantidad de casos abiertos, asignados y cerrados por período
+    ---
+    - **interval**: day, week o month
+    - **start**: fecha de inicio, por defecto 30 períodos antes de `end`
+    - **end**: fecha de término (inclusive), por defecto hoy
+    - **business_id**: filtra por empresa
+    - **area_id**: filtra por área
+    - **professional_id**: filtra por profesional
+    """
+    filters = {"business_id": business_id, "area_id": area_id, "professional_id": professional_id}
+
+    items = await get_timeseries(db, interval, start, end,
+                                 {key: value for key, value in filters.items() if value is not None})
+
+    return {"interval": interval, "items": items}
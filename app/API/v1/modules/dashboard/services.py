@@ -0,0 +1,205 @@
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple, Union
+from fastapi.exceptions import HTTPException
+from sqlalchemy import cast, literal, literal_column, text, union_all
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm.session import Session
+from sqlalchemy.sql.functions import func
+from sqlalchemy.sql.sqltypes import DateTime
+from app.database.main import engine
+from app.settings import TIMESERIES_TIMEZONE, TIMESERIES_MAX_BUCKETS, TIMESERIES_CACHE_TTL, TIMESERIES_CACHE_SIZE
+from .model import CaseStateCounter
+from ..social_cases.model import SocialCase, SocialCaseClose, SocialCaseDerivation
+from ...helpers.cache import TTLCache
+
+METRICS = ("opened", "assigned", "closed")
+
+# Llave del advisory lock que permite un solo recálculo de contadores a la vez
+COUNTERS_LOCK_ID = 7310001
+
+timeseries_cache = TTLCache(ttl=TIMESERIES_CACHE_TTL, max_size=TIMESERIES_CACHE_SIZE)
+
+
+def get_counter_key(social_case: SocialCase, state: str) -> Tuple[int, int, str]:
+    return (social_case.business_id or 0, social_case.area_id, state)
+
+
+def apply_counter_deltas(db: Union[Session, Connection], deltas: Dict[Tuple[int, int, str], int]):
+    # Orden fijo de filas para que dos transiciones cruzadas no se bloqueen entre sí
+    rows = [{"business_id": business_id, "area_id": area_id, "state": state, "count": delta}
+            for (business_id, area_id, state), delta in sorted(deltas.items()) if delta]
+    if not rows:
+        return
+
+    stmt = insert(CaseStateCounter).values(rows)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[CaseStateCounter.business_id, CaseStateCounter.area_id, CaseStateCounter.state],
+        set_={"count": CaseStateCounter.count + stmt.excluded.count, "update_at": func.now()}))
+
+
+def count_new_case(db: Session, social_case: SocialCase):
+    """
+    Suma el caso recién creado a los contadores, se confirma junto con la
+    transacción del caso
+    """
+    if social_case.is_active is not False:
+        apply_counter_deltas(db, {get_counter_key(social_case, social_case.state): 1})
+
+
+def set_case_state(db: Session, social_case: SocialCase, state: str):
+    """
+    Cambia el estado del caso moviendo su conteo al nuevo estado
+    """
+    if social_case.is_active and social_case.state != state:
+        apply_counter_deltas(db, {get_counter_key(social_case, social_case.state): -1,
+                                  get_counter_key(social_case, state): 1})
+    social_case.state = state
+
+
+def get_counter_drift(conn) -> Dict[Tuple[int, int, str], int]:
+    """
+    Diferencia entre el conteo real y los contadores, leídos en la misma
+    foto de la base de datos
+    """
+    business_id = func.coalesce(SocialCase.business_id, 0)
+    actual = {(row[0], row[1], row[2]): row[3] for row in conn.execute(select(
+        business_id, SocialCase.area_id, SocialCase.state, func.count(SocialCase.id)).filter(
+            SocialCase.is_active == True).group_by(  # noqa: E712
+                business_id, SocialCase.area_id, SocialCase.state))}
+    stored = {(row.business_id, row.area_id, row.state): row.count for row in conn.execute(
+        select(CaseStateCounter.business_id, CaseStateCounter.area_id, CaseStateCounter.state,
+               CaseStateCounter.count))}
+
+    return {key: actual.get(key, 0) - stored.get(key, 0) for key in actual.keys() | stored.keys()
+            if actual.get(key, 0) != stored.get(key, 0)}
+
+
+def reconcile_state_counters() -> int:
+    """
+    Recalcula los contadores desde social_case y corrige los que difieran.
+    Retorna la cantidad de contadores corregidos, 0 si otro proceso ya está
+    recalculando.
+
+    El conteo corre en una transacción REPEATABLE READ sin bloquear a las
+    escrituras; la diferencia se suma después como delta, así los cambios
+    confirmados entre ambos pasos no se pierden.
+    """
+    with engine.connect() as conn:
+        with conn.begin():
+            if not conn.execute(select(func.pg_try_advisory_lock(COUNTERS_LOCK_ID))).scalar():
+                return 0
+        try:
+            with conn.begin():
+                conn.execute(text("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ"))
+                drift = get_counter_drift(conn)
+            with conn.begin():
+                apply_counter_deltas(conn, drift)
+            return len(drift)
+        finally:
+            with conn.begin():
+                conn.execute(select(func.pg_advisory_unlock(COUNTERS_LOCK_ID)))
+
+
+def truncate_bucket(value: date, interval: str) -> datetime:
+    value = datetime(value.year, value.month, value.day)
+    if interval == "week":
+        return value - timedelta(days=value.weekday())
+    if interval == "month":
+        return value.replace(day=1)
+    return value
+
+
+def shift_bucket(value: datetime, interval: str, steps: int = 1) -> datetime:
+    if interval == "day":
+        return value + timedelta(days=steps)
+    if interval == "week":
+        return value + timedelta(weeks=steps)
+    month = value.month - 1 + steps
+    return value.replace(year=value.year + month // 12, month=month % 12 + 1)
+
+
+def get_buckets(start: datetime, end: datetime, interval: str) -> List[datetime]:
+    buckets = []
+    while start <= end:
+        buckets.append(start)
+        start = shift_bucket(start, interval)
+        if len(buckets) > TIMESERIES_MAX_BUCKETS:
+            raise HTTPException(
+                status_code=400, detail="El rango no puede superar %s períodos" % TIMESERIES_MAX_BUCKETS)
+    return buckets
+
+
+def build_timeseries_query(interval: str, start: datetime, end: datetime, filters: dict):
+    """
+    Conteo por período de casos abiertos, asignados y cerrados en
+    [start, end), en hora local. El rango se filtra sobre la columna sin
+    transformar para usar su índice.
+
+    Los bordes se envían como timestamp sin zona para que Postgres los
+    interprete en TIMESERIES_TIMEZONE y no en la hora del proceso.
+    """
+    start = func.timezone(TIMESERIES_TIMEZONE, cast(start, DateTime))
+    end = func.timezone(TIMESERIES_TIMEZONE, cast(end, DateTime))
+
+    def count_by_bucket(metric: str, column, query):
+        bucket = func.date_trunc(interval, func.timezone(TIMESERIES_TIMEZONE, column))
+        query = query.add_columns(literal(metric).label("metric"), bucket.label("bucket"),
+                                  func.count().label("value")).filter(
+            column >= start,
+            column < end,
+            SocialCase.is_active == True,  # noqa: E712
+            *[getattr(SocialCase, key) == value for key, value in filters.items()])
+        return query.group_by(literal_column("bucket"))
+
+    return union_all(
+        count_by_bucket("opened", SocialCase.created_at, select().select_from(SocialCase)),
+        count_by_bucket("assigned", SocialCaseDerivation.created_at, select().join_from(
+            SocialCaseDerivation, SocialCase, SocialCase.derivation_id == SocialCaseDerivation.id)),
+        count_by_bucket("closed", SocialCaseClose.created_at, select().join_from(
+            SocialCaseClose, SocialCase, SocialCase.closing_id == SocialCaseClose.id)))
+
+
+async def get_timeseries(db: AsyncSession, interval: str, start: Optional[date],
+                         end: Optional[date], filters: dict, default_buckets: int = 30) -> List[dict]:
+    """
+    Retorna los conteos por período entre `start` y `end` (inclusive).
+    Los períodos cerrados se leen del cache y solo se consultan los que
+    falten junto con el período actual.
+    """
+    now = (await db.execute(select(func.timezone(TIMESERIES_TIMEZONE, func.now())))).scalar()
+    current = truncate_bucket(now, interval)
+    last = truncate_bucket(end, interval) if end else current
+    first = truncate_bucket(start, interval) if start else shift_bucket(last, interval, 1 - default_buckets)
+
+    if first > last:
+        raise HTTPException(
+            status_code=400, detail="La fecha de inicio debe ser anterior a la de término")
+
+    buckets = get_buckets(first, last, interval)
+    key = (interval, tuple(sorted(filters.items())))
+    values = {}
+    missing = []
+    for bucket in buckets:
+        cached = timeseries_cache.get(key + (bucket,)) if bucket < current else None
+        if cached is None:
+            missing.append(bucket)
+        else:
+            values[bucket] = cached
+
+    if missing:
+        query = build_timeseries_query(interval, missing[0], shift_bucket(missing[-1], interval), filters)
+        counts = {bucket: dict.fromkeys(METRICS, 0) for bucket in missing}
+        for row in (await db.execute(query)).all():
+            # Solo los períodos pedidos, el rango consultado puede incluir otros ya cacheados
+            if row.bucket in counts:
+                counts[row.bucket][row.metric] = row.value
+
+        for bucket, value in counts.items():
+            values[bucket] = value
+            if bucket < current:
+                timeseries_cache.set(key + (bucket,), value)
+
+    return [{"bucket": bucket.date(), **values[bucket]} for bucket in buckets]
@@ -0,0 +1,94 @@
+import calendar
+import json
+from datetime import datetime, timedelta
+from typing import Iterator
+from sqlalchemy.orm import Query
+from sqlalchemy.sql.elements import and_, or_
+from sqlalchemy.sql.functions import func
+from ...helpers.pagination import Projection, encode_json_value
+from .model import InterventionPlan
+
+# Cada cuánto se repite una tarea, en días o en meses. Las frecuencias que
+# no están aquí (FECHA FIJA) ocurren solo en next_date.
+FREQUENCY_DAYS = {"DIARIA": 1, "SEMANAL": 7, "QUINCENAL": 14}
+FREQUENCY_MONTHS = {"MENSUAL": 1, "BIMESTRAL": 2, "TRIMESTRAL": 3, "SEMESTRAL": 6, "ANUAL": 12}
+RECURRING_FREQUENCIES = [*FREQUENCY_DAYS, *FREQUENCY_MONTHS]
+
+
+def add_months(value: datetime, months: int) -> datetime:
+    month = value.month - 1 + months
+    year = value.year + month // 12
+    month = month % 12 + 1
+    return value.replace(year=year, month=month, day=min(value.day, calendar.monthrange(year, month)[1]))
+
+
+def calendar_condition(start: datetime, end: datetime):
+    """
+    Tareas activas con ocurrencias dentro de [start, end]. Cada rama del OR
+    usa su índice: las que vencen en el rango con ix_intervention_plan_next_date
+    y las recurrentes que vencieron antes con ix_intervention_plan_recurring_next_date.
+    """
+    return and_(InterventionPlan.is_active == True,  # noqa: E712
+                or_(and_(InterventionPlan.next_date >= start, InterventionPlan.next_date <= end),
+                    and_(func.upper(InterventionPlan.frequency).in_(RECURRING_FREQUENCIES),
+                         InterventionPlan.next_date <= end)))
+
+
+def expand_occurrences(next_date: datetime, frequency: str, start: datetime, end: datetime) -> Iterator[datetime]:
+    """
+    Fechas de la tarea dentro de [start, end]. La primera ocurrencia es
+    `next_date`, las anteriores ya no están pendientes.
+    """
+    frequency = (frequency or "").upper()
+
+    if frequency in FREQUENCY_DAYS:
+        step = timedelta(days=FREQUENCY_DAYS[frequency])
+        skipped = max(0, -(-(start - next_date) // step))
+        occurrence = next_date + step * skipped
+        while occurrence <= end:
+            yield occurrence
+            occurrence += step
+
+    elif frequency in FREQUENCY_MONTHS:
+        step = FREQUENCY_MONTHS[frequency]
+        # Se calcula desde next_date para no arrastrar el recorte de fin de mes
+        count = max(0, ((start.year - next_date.year) * 12 + start.month - next_date.month) // step - 1)
+        occurrence = add_months(next_date, count * step)
+        while occurrence <= end:
+            if occurrence >= start:
+                yield occurrence
+            count += 1
+            occurrence = add_months(next_date, count * step)
+
+    elif start <= next_date <= end:
+        yield next_date
+
+
+def stream_calendar(query: Query, projection: Projection, start: datetime, end: datetime,
+                    batch_size: int) -> Iterator[bytes]:
+    """
+    Genera un arreglo JSON con una entrada por ocurrencia. Las tareas se
+    leen con un cursor del servidor y se expanden a medida que llegan.
+    """
+    next_date = projection.aliases.index("nextDate")
+    frequency = projection.aliases.index("frequency")
+    rows = query.execution_options(stream_results=True).yield_per(batch_size)
+
+    buffer = []
+    empty = True
+    for row in rows:
+        plan = None
+        for occurrence in expand_occurrences(row[next_date], row[frequency], start, end):
+            if plan is None:
+                plan = projection.serialize([row])[0]
+            buffer.append(json.dumps({**plan, "date": occurrence}, ensure_ascii=False,
+                                     default=encode_json_value))
+            if len(buffer) >= batch_size:
+                yield (("[" if empty else ",") + ",".join(buffer)).encode("utf-8")
+                buffer = []
+                empty = False
+
+    if buffer:
+        yield (("[" if empty else ",") + ",".join(buffer) + "]").encode("utf-8")
+    else:
+        yield ("[]" if empty else "]").encode("utf-8")
@@ -1,8 +1,9 @@
-from sqlalchemy.orm import relationship
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import deferred, relationship
 from sqlalchemy.sql.schema import ForeignKey
 from sqlalchemy.sql.sqltypes import Boolean, DateTime
 from app.database.base_class import Base, TimestampMixin, AuthorMixin
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, FetchedValue, Index, Integer, String, func
 
 
 class InterventionPlan(Base, AuthorMixin, TimestampMixin):
@@ -18,6 +19,22 @@ class InterventionPlan(Base, AuthorMixin, TimestampMixin):
     professional_names = Column(String(200), nullable=False)
     is_active = Column(Boolean, nullable=False, default=True)
     is_completed = Column(Boolean, nullable=False, server_default="0")
+    # Mantenida por el trigger intervention_plan_search_columns
+    search_vector = deferred(Column(TSVECTOR, server_default=FetchedValue(), server_onupdate=FetchedValue()))
 
     social_case = relationship(
         "SocialCase", back_populates="intervention_plans", lazy="select")
+
+
+Index("ix_intervention_plan_social_case_id", InterventionPlan.social_case_id)
+Index("ix_intervention_plan_professional_next_date",
+      InterventionPlan.professional_id, InterventionPlan.next_date,
+      postgresql_where=InterventionPlan.is_active == True)  # noqa: E712
+Index("ix_intervention_plan_next_date", InterventionPlan.next_date,
+      postgresql_where=InterventionPlan.is_active == True)  # noqa: E712
+# Tareas recurrentes del calendario, filtradas por upper(frequency)
+Index("ix_intervention_plan_recurring_next_date",
+      func.upper(InterventionPlan.frequency), InterventionPlan.next_date,
+      postgresql_where=InterventionPlan.is_active == True)  # noqa: E712
+Index("ix_intervention_plan_created_at", InterventionPlan.created_at, InterventionPlan.id)
+Index("ix_intervention_plan_search_vector", InterventionPlan.search_vector, postgresql_using="gin")
@@ -1,20 +1,26 @@
-from datetime import datetime
-from typing import List, Optional
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Union
 from fastapi import status, Request, APIRouter
 from fastapi.encoders import jsonable_encoder
 from fastapi.param_functions import Depends, Query
 from fastapi.exceptions import HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
 from sqlalchemy.orm import joinedload
 from sqlalchemy.orm.session import Session
-from sqlalchemy.sql.elements import and_, or_
-from fastapi_pagination import Params, Page
-from fastapi_pagination.ext.sqlalchemy import paginate
-from app.database.main import get_database
+from fastapi_pagination import Params
+from app.settings import COUNT_MODE, CALENDAR_DEFAULT_DAYS, CALENDAR_MAX_DAYS, CALENDAR_BATCH_SIZE
+from app.database.main import get_database, get_read_database, get_async_read_database
 from ...middlewares.auth import JWTBearer
-from ...helpers.fetch_data import fetch_service, fetch_users_service, get_employee_data
+from ...middlewares.query_budget import QueryBudget
+from ...helpers.fetch_data import fetch_concurrently, fetch_service, fetch_users_service, get_employee_data
 from ...helpers.crud import get_updated_obj
+from ...helpers.filters import FilterSet
 from ...helpers.humanize_date import get_time_ago
+from ...helpers.pagination import COUNT_MODES, CountedPage, CursorPage, Projection, paginate_counted, paginate_cursor, projection_response
 from ...helpers.schema import SuccessResponse
+from .calendar import calendar_condition, stream_calendar
 from .model import InterventionPlan
 from .schema import PlanCreate, PlanDetails, PlanItem
 
@@ -23,60 +29,83 @@ router = APIRouter(prefix="/intervention-plans",
                    dependencies=[Depends(JWTBearer())])
 
 
-@router.get("/calendar", response_model=List[PlanItem])
-def get_all(users: List[int] = Query(None),
-            user_id: Optional[int] = None,
-            start_date: Optional[datetime] = Query(None, alias="startDate"),
-            end_date: Optional[datetime] = Query(None, alias="endDate"),
-            db: Session = Depends(get_database)):
+plan_item_projection = Projection(InterventionPlan, PlanItem)
+
+
+@router.get("/calendar", dependencies=[Depends(QueryBudget(statements=1))])
+def get_calendar(users: List[int] = Query(None),
+                 user_id: Optional[int] = None,
+                 start_date: Optional[datetime] = Query(None, alias="startDate"),
+                 end_date: Optional[datetime] = Query(None, alias="endDate"),
+                 db: Session = Depends(get_read_database)):
     """
-    Retorna los planes de intervención para el calendario
+    Retorna las ocurrencias de las tareas activas entre `startDate` y
+    `endDate`, expandiendo la frecuencia de cada tarea. Cada elemento es la
+    tarea con la fecha de la ocurrencia en `date`.
     ---
+    - **startDate**: por defecto ahora
+    - **endDate**: por defecto CALENDAR_DEFAULT_DAYS días después de `startDate`
     """
-    filters = []
-    users_ids = []
-    users_filters = []
+    start = start_date or datetime.now(timezone.utc)
+    if not start.tzinfo:
+        start = start.replace(tzinfo=timezone.utc)
+    end = end_date or start + timedelta(days=CALENDAR_DEFAULT_DAYS)
+    if not end.tzinfo:
+        end = end.replace(tzinfo=timezone.utc)
+
+    if end < start or end - start > timedelta(days=CALENDAR_MAX_DAYS):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="El rango debe ser de 0 a %s días" % CALENDAR_MAX_DAYS)
+
+    users_ids = [*(users or []), *([user_id] if user_id else [])]
 
-    if start_date and end_date:
-        filters.append(InterventionPlan.next_date >= start_date)
-        filters.append(InterventionPlan.next_date <= end_date)
-    if users:
-        for i in users:
-            users_ids.append(i)
-    if user_id:
-        users_ids.append(user_id)
+    # Las tareas recurrentes anteriores a startDate pueden repetirse dentro del rango
+    filters = [calendar_condition(start, end)]
+    if users_ids:
+        filters.append(InterventionPlan.professional_id.in_(users_ids))
 
-    if len(users_ids) > 0:
-        users_filters.append(InterventionPlan.professional_id.in_(users_ids))
-    return db.query(InterventionPlan).filter(and_(*filters, *users_filters, InterventionPlan.is_active == True)).order_by(InterventionPlan.created_at).all()
+    query = db.query(*plan_item_projection.columns).filter(*filters).order_by(
+        InterventionPlan.next_date, InterventionPlan.id)
 
+    return StreamingResponse(stream_calendar(query, plan_item_projection, start, end, CALENDAR_BATCH_SIZE),
+                             media_type="application/json")
 
-@ router.get("", response_model=Page[PlanItem])
+
+@ router.get("", response_model=Union[CountedPage[PlanItem], CursorPage[PlanItem]],
+             dependencies=[Depends(QueryBudget(statements=3))])
 def get_all(social_case_id: int = Query(None, alias="socialCaseId"),
             user_id: Optional[int] = None,
             rol: Optional[str] = None,
             search: str = None,
-            db: Session = Depends(get_database),
+            pagination: str = Query("page", regex="^(page|cursor)$"),
+            cursor: Optional[str] = None,
+            count: str = Query(COUNT_MODE, regex=COUNT_MODES),
+            db: Session = Depends(get_read_database),
             pag_params: Params = Depends()):
     """
     Retorna los planes de intervención de casos sociales
     ---
+    - **pagination**: page (por defecto) o cursor, en modo cursor la
+    respuesta incluye `nextCursor` para pedir la siguiente página
+    - **count**: exact, cached o estimated, `exactTotal` indica si el
+    total es exacto
     """
-    filters = []
-    search_filters = []
-    filterById = []
+    filters = FilterSet().equals(InterventionPlan.social_case_id, social_case_id).search(
+        InterventionPlan.search_vector, search)
 
     if rol != 'ADMIN' and rol != 'JEFATURA':
-        filterById.append(InterventionPlan.professional_id == user_id)
-    if social_case_id:
-        filters.append(InterventionPlan.social_case_id == social_case_id)
-    if search:
-        formatted_search = "{}%".format(search)
-        search_filters.append(
-            InterventionPlan.management_name.ilike(formatted_search))
-        search_filters.append(
-            InterventionPlan.professional_names.ilike(formatted_search))
-    return paginate(db.query(InterventionPlan).filter(and_(or_(*filters, *search_filters), *filterById)).options(joinedload(InterventionPlan.social_case)).order_by(InterventionPlan.created_at), pag_params)
+        filters.add(InterventionPlan.professional_id == user_id)
+    search_rank = filters.rank
+    query = db.query(*plan_item_projection.columns).filter(filters.condition())
+
+    if pagination == "cursor":
+        return projection_response(plan_item_projection, paginate_cursor(
+            query, InterventionPlan.created_at, InterventionPlan.id, cursor, pag_params.size, descending=False))
+
+    if search_rank is not None:
+        query = query.order_by(search_rank.desc())
+    return projection_response(plan_item_projection, paginate_counted(
+        query.order_by(InterventionPlan.created_at), pag_params, count))
 
 
 @ router.post("", response_model=PlanItem)
@@ -100,10 +129,10 @@ def create_case(req: Request,
     return db_plan
 
 
-@ router.get("/{id}", response_model=PlanDetails)
-def get_one(req: Request,
-            id: int,
-            db: Session = Depends(get_database)):
+@ router.get("/{id}", response_model=PlanDetails, dependencies=[Depends(QueryBudget(statements=1))])
+async def get_one(req: Request,
+                  id: int,
+                  db: AsyncSession = Depends(get_async_read_database)):
     """
     Retorna los detalles de una tarea del Plan de intervención
     ---
@@ -111,20 +140,23 @@ def get_one(req: Request,
     - **body**: body
     """
 
-    found_plan = db.query(InterventionPlan).filter(
-        InterventionPlan.id == id).options(joinedload(InterventionPlan.social_case)).first()
+    result = await db.execute(select(InterventionPlan).filter(
+        InterventionPlan.id == id).options(joinedload(InterventionPlan.social_case)))
+    found_plan = result.scalars().first()
 
     if not found_plan:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="No existe una tarea con este id: %s".format(id))
-    professional = fetch_users_service(req, found_plan.professional_id)
-    employee = get_employee_data(req, found_plan.social_case.employee_id)
+    data = await fetch_concurrently({
+        "professional": (fetch_users_service, req, found_plan.professional_id),
+        "employee": (get_employee_data, req, found_plan.social_case.employee_id),
+    })
 
     return {**found_plan.__dict__,
-            "professional": professional,
+            "professional": data["professional"],
             "social_case": {
                 **found_plan.social_case.__dict__,
-                "employee": employee
+                "employee": data["employee"]
             }}
 
 
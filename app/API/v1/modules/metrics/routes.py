@@ -0,0 +1,25 @@
+from fastapi import APIRouter
+from fastapi.param_functions import Depends
+from app.database.main import replicas
+from ...middlewares.auth import JWTBearer, get_auth_stats
+from ...middlewares.query_budget import get_budget_stats
+from ...helpers.fetch_data import get_cache_stats, get_flight_stats
+from ...helpers.http_client import http
+
+router = APIRouter(prefix="/metrics",
+                   tags=["Métricas"],
+                   dependencies=[Depends(JWTBearer())])
+
+
+@router.get("")
+def get_metrics():
+    """
+    Retorna métricas internas del servicio
+    ---
+    """
+    return {"auth": get_auth_stats(),
+            "cache": get_cache_stats(),
+            "singleFlight": get_flight_stats(),
+            "services": http.as_dict(),
+            "database": replicas.as_dict(),
+            "queries": get_budget_stats()}
@@ -1,11 +1,12 @@
 from ast import Str
 from typing import List
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import deferred, relationship
 from sqlalchemy.sql.schema import ForeignKey
 from sqlalchemy.sql.sqltypes import Boolean, DateTime
-from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, TSVECTOR
+from sqlalchemy.sql.functions import func
 from app.database.base_class import Base, TimestampMixin, AuthorMixin
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, FetchedValue, Index, Integer, String
 from ..intervention_plans.model import InterventionPlan
 
 
@@ -31,6 +32,9 @@ class SocialCase(Base, AuthorMixin, TimestampMixin):
     assistance_derivation_id = Column(ARRAY(Integer), nullable=True)
     derivation_id = Column(Integer, ForeignKey("social_case_derivation.id"))
     closing_id = Column(Integer, ForeignKey("social_case_close.id"))
+    # Mantenidas por el trigger social_case_search_columns
+    employee_rut_normalized = Column(String(12), server_default=FetchedValue(), server_onupdate=FetchedValue())
+    search_vector = deferred(Column(TSVECTOR, server_default=FetchedValue(), server_onupdate=FetchedValue()))
     intervention_plans = relationship(
         "InterventionPlan", back_populates="social_case", lazy="select")
     derivation = relationship(
@@ -39,6 +43,29 @@ class SocialCase(Base, AuthorMixin, TimestampMixin):
         "SocialCaseClose", uselist=False, lazy="joined")
 
 
+Index("ix_social_case_created_at", SocialCase.created_at.desc())
+Index("ix_social_case_business_created_at",
+      SocialCase.business_id, SocialCase.created_at.desc())
+Index("ix_social_case_business_construction_created_at",
+      SocialCase.business_id, SocialCase.construction_id, SocialCase.created_at.desc())
+Index("ix_social_case_professional_created_at",
+      SocialCase.professional_id, SocialCase.created_at.desc())
+Index("ix_social_case_area_created_at",
+      SocialCase.area_id, SocialCase.created_at.desc())
+Index("ix_social_case_state_created_at",
+      SocialCase.state, SocialCase.created_at.desc())
+Index("ix_social_case_date", SocialCase.date)
+Index("ix_social_case_employee_active", SocialCase.employee_id, SocialCase.created_at,
+      postgresql_where=SocialCase.is_active == True)  # noqa: E712
+Index("ix_social_case_assistance_derivation_id",
+      SocialCase.assistance_derivation_id, postgresql_using="gin")
+Index("ix_social_case_employee_rut_normalized", SocialCase.employee_rut_normalized,
+      postgresql_ops={"employee_rut_normalized": "text_pattern_ops"})
+Index("ix_social_case_search_vector", SocialCase.search_vector, postgresql_using="gin")
+Index("ix_social_case_derivation_id", SocialCase.derivation_id)
+Index("ix_social_case_closing_id", SocialCase.closing_id)
+
+
 class SocialCaseDerivation(Base, AuthorMixin, TimestampMixin):
     __tablename__ = "social_case_derivation"
     id = Column(Integer, primary_key=True, unique=True, autoincrement=True)
@@ -51,6 +78,9 @@ class SocialCaseDerivation(Base, AuthorMixin, TimestampMixin):
         "AssignedProfessional", back_populates="derivation", lazy="joined")
 
 
+Index("ix_social_case_derivation_created_at", SocialCaseDerivation.created_at)
+
+
 class AssignedProfessional(Base, AuthorMixin, TimestampMixin):
     __tablename__ = "social_case_assistance"
     id = Column(Integer, primary_key=True, unique=True, autoincrement=True)
@@ -69,3 +99,28 @@ class SocialCaseClose(Base, AuthorMixin, TimestampMixin):
     professional_id = Column(Integer, nullable=False)
     professional_names = Column(String(120), nullable=False)
     observations = Column(String(900), nullable=False)
+
+
+Index("ix_social_case_close_created_at", SocialCaseClose.created_at)
+
+
+class EmployeeStatusOutbox(Base, TimestampMixin):
+    __tablename__ = "employee_status_outbox"
+    id = Column(Integer, primary_key=True, unique=True, autoincrement=True)
+    employee_id = Column(Integer, nullable=False)
+    payload = Column(JSONB, nullable=False)
+    attempts = Column(Integer, nullable=False, server_default="0")
+    next_attempt_at = Column(DateTime(timezone=True),
+                             nullable=False, server_default=func.now())
+    processed_at = Column(DateTime(timezone=True), nullable=True)
+    last_error = Column(String(500), nullable=True)
+    claimed_until = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_employee_status_outbox_pending", "next_attempt_at",
+              postgresql_where=processed_at.is_(None)),
+        Index("ix_employee_status_outbox_employee_pending", "employee_id",
+              postgresql_where=processed_at.is_(None)),
+        Index("ix_employee_status_outbox_employee_claimed", "employee_id",
+              postgresql_where=claimed_until.isnot(None)),
+    )
@@ -1,26 +1,31 @@
 from ast import alias
 from datetime import datetime
 from os import getegid
-from typing import List, Optional
+from tempfile import SpooledTemporaryFile
+from typing import Dict, List, Optional, Union
 
-from sqlalchemy.orm import joinedload
-from sqlalchemy.sql.functions import func
-from fastapi import status, Request, APIRouter
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from fastapi import status, Request, APIRouter, BackgroundTasks
 from fastapi.encoders import jsonable_encoder
 from fastapi.param_functions import Depends, Query
 from fastapi.exceptions import HTTPException
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm.session import Session
 from sqlalchemy.sql.elements import and_, or_
-from fastapi_pagination import Params, Page
-from fastapi_pagination.ext.sqlalchemy import paginate
-from app.settings import SERVICES
-from app.database.main import get_database
+from fastapi_pagination import Params
+from starlette.concurrency import run_in_threadpool
+from app.settings import SERVICES, COUNT_MODE, IMPORT_SPOOL_SIZE, COLLECT_MAX_EMPLOYEES, OUTBOX_BATCH_SIZE
+from app.database.main import get_database, get_read_database, get_async_read_database
 from ...middlewares.auth import JWTBearer
-from ...helpers.fetch_data import fetch_parameter_data, fetch_service, fetch_users_service, get_business_data, get_employee_data, get_assistance_information
+from ...middlewares.query_budget import QueryBudget
+from ...helpers.fetch_data import fetch_batch, fetch_concurrently, fetch_parameter_data, fetch_service, fetch_users_batch, fetch_users_service, get_business_data, get_employee_data, get_assistance_information
+from ...helpers.pagination import COUNT_MODES, CountedPage, CursorPage, Projection, paginate_counted, paginate_cursor, projection_response
 from ...helpers.schema import SuccessResponse
 from .model import SocialCase, SocialCaseDerivation, SocialCaseClose, AssignedProfessional
-from .schema import ClosingCreate, ClosingItem, DerivationCreate, DerivationDetails, DerivationItem, SocialCaseBase, SocialCaseCreate, SocialCaseDetails, SocialCaseEmployee, SocialCaseItem, SocialCaseSimple, SocialCaseDerivationCreate, SocialCaseMail
-from .services import create_professionals, get_assistance, patch_employee_status
+from .schema import ClosingCreate, ClosingItem, DerivationCreate, DerivationDetails, DerivationItem, ImportResult, SocialCaseCollect, SocialCaseBase, SocialCaseCreate, SocialCaseDetails, SocialCaseEmployee, SocialCaseItem, SocialCaseSimple, SocialCaseDerivationCreate, SocialCaseMail
+from .services import EXPORT_COLUMNS, EXPORT_MEDIA_TYPES, build_professionals, create_professionals, get_assistance, get_case_filters, get_collect_query, enqueue_employee_status, dispatch_employee_status, dispatch_new_employee_statuses, import_social_cases, stream_cases
+from ..dashboard.services import count_new_case, set_case_state
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 import smtplib
@@ -30,7 +35,11 @@ router = APIRouter(prefix="/social-cases",
                    dependencies=[Depends(JWTBearer())])
 
 
-@router.get("", response_model=Page[SocialCaseItem])
+case_item_projection = Projection(SocialCase, SocialCaseItem)
+
+
+@router.get("", response_model=Union[CountedPage[SocialCaseItem], CursorPage[SocialCaseItem]],
+            dependencies=[Depends(QueryBudget(statements=3))])
 def get_all(business_id: int = Query(None, alias="businessId"),
             start_date: Optional[datetime] = Query(None, alias="startDate"),
             end_date: Optional[datetime] = Query(None, alias="endDate"),
@@ -41,47 +50,64 @@ def get_all(business_id: int = Query(None, alias="businessId"),
             delegation: str = None,
             area_id: int = Query(None, alias="areaId"),
             search: str = None,
-            db: Session = Depends(get_database),
+            pagination: str = Query("page", regex="^(page|cursor)$"),
+            cursor: Optional[str] = None,
+            count: str = Query(COUNT_MODE, regex=COUNT_MODES),
+            db: Session = Depends(get_read_database),
             pag_params: Params = Depends()):
     """
     Retorna los casos sociales aplicando filtros
     ---
+    - **pagination**: page (por defecto) o cursor, en modo cursor la
+    respuesta incluye `nextCursor` para pedir la siguiente página
+    - **count**: exact, cached o estimated, `exactTotal` indica si el
+    total es exacto
+    """
+    condition, search_rank = get_case_filters(business_id, start_date, end_date, state, assistance_id,
+                                              professional_id, area_id, search)
+    query = db.query(*case_item_projection.columns).filter(condition)
+
+    if pagination == "cursor":
+        return projection_response(case_item_projection, paginate_cursor(
+            query, SocialCase.created_at, SocialCase.id, cursor, pag_params.size))
+
+    if search_rank is not None:
+        query = query.order_by(search_rank.desc())
+    return projection_response(case_item_projection, paginate_counted(
+        query.order_by(SocialCase.created_at.desc()), pag_params, count))
+
+
+@router.get("/export", dependencies=[Depends(QueryBudget(statements=1))])
+def export_cases(business_id: int = Query(None, alias="businessId"),
+                 start_date: Optional[datetime] = Query(None, alias="startDate"),
+                 end_date: Optional[datetime] = Query(None, alias="endDate"),
+                 state: str = None,
+                 assistance_id: int = Query(None, alias="assistanceId"),
+                 professional_id: int = Query(None, alias="professionalId"),
+                 area_id: int = Query(None, alias="areaId"),
+                 search: str = None,
+                 format: str = Query("csv", regex="^(csv|ndjson)$"),
+                 db: Session = Depends(get_read_database)):
+    """
+    Exporta todos los casos sociales que cumplen los filtros de la lista,
+    el archivo se genera a medida que se leen las filas
+    ---
+    - **format**: csv (por defecto) o ndjson
     """
-    filters = []
-    extraFilters = []
-    search_filters = []
-    date_filters = []
-
-    if(business_id):
-        filters.append(SocialCase.business_id == business_id)
-    if(professional_id):
-        filters.append(SocialCase.professional_id == professional_id)
-        extraFilters.append(SocialCase.assistance_derivation_id.contains([professional_id]))
-    if(assistance_id):
-        filters.append(SocialCase.professional_id == assistance_id)
-        extraFilters.append(SocialCase.assistance_derivation_id.contains([assistance_id]))
-    if(area_id):
-        filters.append(SocialCase.area_id == area_id)
-    if (start_date):
-        date_filters.append(func.date(SocialCase.date) >= start_date)
-    if (end_date):
-        date_filters.append(func.date(SocialCase.date) <= end_date)
-    if (state):
-        filters.append(SocialCase.state == state)
-    if(search):
-        formatted_search = "{}%".format(search)
-        search_filters.append(SocialCase.employee_rut.ilike(formatted_search))
-        search_filters.append(
-            SocialCase.employee_names.ilike(formatted_search))
-        search_filters.append(
-            SocialCase.business_name.ilike(formatted_search))
-
-    return paginate(db.query(SocialCase).filter(or_(and_(*filters), *extraFilters, *search_filters, and_(*date_filters))).order_by(SocialCase.created_at.desc()), pag_params)
-
-
-@router.get("/employee", response_model=Page[SocialCaseEmployee])
+    condition, search_rank = get_case_filters(business_id, start_date, end_date, state, assistance_id,
+                                              professional_id, area_id, search)
+    query = db.query(*EXPORT_COLUMNS).filter(condition).order_by(
+        SocialCase.created_at.desc(), SocialCase.id.desc())
+
+    return StreamingResponse(stream_cases(query, format),
+                             media_type=EXPORT_MEDIA_TYPES[format],
+                             headers={"Content-Disposition": 'attachment; filename="casos_sociales.%s"' % format})
+
+
+@router.get("/employee", response_model=CountedPage[SocialCaseEmployee])
 def get_employees_to_attend(req: Request, business_id: int = Query(None, alias="businessId"), user_id: int = Query(None, alias="userId"), construction_id: int = Query(None, alias="constructionId"),
-                            db: Session = Depends(get_database),
+                            count: str = Query(COUNT_MODE, regex=COUNT_MODES),
+                            db: Session = Depends(get_read_database),
                             pag_params: Params = Depends()):
     if business_id:
         business = get_business_data(req, business_id)
@@ -93,27 +119,53 @@ def get_employees_to_attend(req: Request, business_id: int = Query(None, alias="
             filters.append(SocialCase.state != "CERRADO")
             filters.append(SocialCase.is_active != False)
 
-            result = paginate(db.query(SocialCase).filter(
-                and_(*filters), and_(or_(SocialCase.created_by == user_id, SocialCase.assistance_derivation_id.contains([user_id])))).order_by(SocialCase.created_at.desc()), pag_params)
-            docs = []
-            for i in result.items:
-                employee = get_employee_data(req, i.employee_id)
-                docs.append({**i.__dict__, "employee": employee,
-                            "motive": "Caso social"})
-            result.items = docs
+            result = paginate_counted(db.query(SocialCase).filter(
+                and_(*filters), and_(or_(SocialCase.created_by == user_id, SocialCase.assistance_derivation_id.contains([user_id])))).order_by(SocialCase.created_at.desc()), pag_params, count)
+            employees = fetch_batch(
+                req, get_employee_data, [i.employee_id for i in result["items"]])
+            result["items"] = [{**i.__dict__, "employee": employees[i.employee_id],
+                                "motive": "Caso social"} for i in result["items"]]
             return result
         else:
             return {"items": [], "page": 1, "size": 30, "total": 0}
 
 
-@router.get("/collect/{id}", response_model=List[SocialCaseSimple])
-def get_all_simple(id: int, db: Session = Depends(get_database)):
-    return db.query(SocialCase).filter(and_(SocialCase.is_active == True, SocialCase.employee_id == id)).options(joinedload(SocialCase.intervention_plans)).order_by(SocialCase.created_at).all()
+# Los planes se cargan en bloques de ids con la misma sentencia, crecen con
+# la cantidad de casos
+@router.post("/collect", response_model=Dict[int, List[SocialCaseSimple]],
+             dependencies=[Depends(QueryBudget(statements=None, repeated=None))])
+async def get_all_simple_batch(body: SocialCaseCollect, db: AsyncSession = Depends(get_async_read_database)):
+    """
+    Retorna los casos sociales activos y sus planes de varios trabajadores,
+    agrupados por id de trabajador
+    ---
+    - **employeeIds**: ids de los trabajadores
+    """
+    employee_ids = list(dict.fromkeys(body.employee_ids))
+    if len(employee_ids) > COLLECT_MAX_EMPLOYEES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="No se pueden consultar más de %s trabajadores" % COLLECT_MAX_EMPLOYEES)
+
+    result = {employee_id: [] for employee_id in employee_ids}
+    if employee_ids:
+        cases = (await db.execute(get_collect_query(employee_ids))).scalars().all()
+        for social_case in cases:
+            result[social_case.employee_id].append(social_case)
+
+    return result
+
+
+@router.get("/collect/{id}", response_model=List[SocialCaseSimple],
+            dependencies=[Depends(QueryBudget(statements=2))])
+async def get_all_simple(id: int, db: AsyncSession = Depends(get_async_read_database)):
+    result = await db.execute(get_collect_query([id]))
+    return result.scalars().all()
 
 
 @router.post("", response_model=SocialCaseItem)
 def create_case(req: Request,
                 body: SocialCaseCreate,
+                background_tasks: BackgroundTasks,
                 db: Session = Depends(get_database)):
     """
     Crea un nuevo caso social 
@@ -126,46 +178,78 @@ def create_case(req: Request,
     db_case = SocialCase(**new_case)
 
     db.add(db_case)
+    count_new_case(db, db_case)
+    enqueue_employee_status(db, body.employee_id, {"has_social_case": True})
     db.commit()
     db.refresh(db_case)
 
-    patch_employee_status(req, body.employee_id, {"has_social_case": True})
+    background_tasks.add_task(dispatch_employee_status, req.token, retries=False, employee_ids=[body.employee_id])
 
     return db_case
 
 
-@router.get("/{id}", response_model=SocialCaseDetails)
-def get_one(req: Request,
-            id: int,
-            db: Session = Depends(get_database)):
+# Una sentencia por bloque importado
+@router.post("/import", response_model=ImportResult,
+             dependencies=[Depends(QueryBudget(statements=None, repeated=None))])
+async def import_cases(req: Request,
+                       background_tasks: BackgroundTasks,
+                       format: Optional[str] = Query(None, regex="^(ndjson|csv)$"),
+                       db: Session = Depends(get_database)):
+    """
+    Carga masiva de casos sociales desde NDJSON o CSV. Las filas inválidas
+    se omiten y se informan con su número de fila.
+    ---
+    - **format**: ndjson o csv, por defecto según el Content-Type
+    """
+    if not format:
+        format = "csv" if "csv" in req.headers.get("content-type", "") else "ndjson"
+
+    with SpooledTemporaryFile(max_size=IMPORT_SPOOL_SIZE) as file:
+        async for chunk in req.stream():
+            file.write(chunk)
+        file.seek(0)
+
+        result = await run_in_threadpool(import_social_cases, db, file, format, req.user_id)
+
+    employee_ids = result.pop("employee_ids")
+    if employee_ids:
+        background_tasks.add_task(dispatch_new_employee_statuses, req.token, employee_ids, OUTBOX_BATCH_SIZE)
+
+    return result
+
+
+@router.get("/{id}", response_model=SocialCaseDetails, dependencies=[Depends(QueryBudget(statements=1))])
+async def get_one(req: Request,
+                  id: int,
+                  db: AsyncSession = Depends(get_async_read_database)):
     """
     Retorna los detalles de un caso social
     ---
     - **id**: id
     """
-    social_case = db.query(SocialCase).filter(
-        SocialCase.id == id).first()
+    result = await db.execute(select(SocialCase).filter(SocialCase.id == id))
+    social_case = result.scalars().first()
 
     if not social_case:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="No existe una tarea con este id: %s".format(id))
 
-    business = get_business_data(req, social_case.business_id)
-    employee = get_employee_data(req, social_case.employee_id)
-    area = fetch_parameter_data(req, "areas", social_case.area_id)
-    professional = fetch_users_service(req,  social_case.professional_id)
-    asistencia = get_assistance_information(req, social_case.assistance_id)
+    data = await fetch_concurrently({
+        "business": (get_business_data, req, social_case.business_id),
+        "employee": (get_employee_data, req, social_case.employee_id),
+        "area": (fetch_parameter_data, req, "areas", social_case.area_id),
+        "professional": (fetch_users_service, req, social_case.professional_id),
+        "asistencia": (get_assistance_information, req, social_case.assistance_id),
+    }, optional=["area"])
+    asistencia = data.pop("asistencia")
 
     return {**social_case.__dict__,
-            "business": business,
-            "employee": employee,
-            "area": area,
+            **data,
             "tema": asistencia["topic"],
-            "professional": professional,
             "observation": asistencia["observation"]}
 
 
-@router.post("/{id}/derivation", response_model=DerivationItem)
+@router.post("/{id}/derivation", response_model=DerivationItem, dependencies=[Depends(QueryBudget(statements=6))])
 def create_derivation(req: Request,
                       id: int,
                       body: DerivationCreate,
@@ -190,61 +274,57 @@ def create_derivation(req: Request,
     new_derivation["created_by"] = user_id
 
     db_derivation = SocialCaseDerivation(**new_derivation)
+    db_derivation.assigned_professionals = build_professionals(professionals, user_id)
 
-    db.add(db_derivation)
-    db.commit()
-    db.refresh(db_derivation)
-
-    create_professionals(db, professionals, db_derivation.id,  user_id)
-
-    social_case.derivation_id = db_derivation.id
-    social_case.state = "ASIGNADO"
+    social_case.derivation = db_derivation
+    set_case_state(db, social_case, "ASIGNADO")
 
     db.add(social_case)
     db.commit()
-    db.refresh(social_case)
 
     return db_derivation
 
 
-@router.get("/{id}/derivation/{derivation_id}", response_model=DerivationDetails)
-def get_derivation(req: Request,
-                   id: int,
-                   derivation_id: int,
-                   db: Session = Depends(get_database)):
+@router.get("/{id}/derivation/{derivation_id}", response_model=DerivationDetails,
+            dependencies=[Depends(QueryBudget(statements=2))])
+async def get_derivation(req: Request,
+                         id: int,
+                         derivation_id: int,
+                         db: AsyncSession = Depends(get_async_read_database)):
     """
     Retorna detalles de la derivación de un casos social
     ---
     - **id**: id
     """
-    social_case = db.query(SocialCase).filter(
-        SocialCase.id == id).first()
+    result = await db.execute(select(SocialCase.id).filter(SocialCase.id == id))
+    social_case = result.scalars().first()
 
     if not social_case:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="No existe un caso social con este id: %s" % format(id))
 
-    derivation = db.query(SocialCaseDerivation).filter(
-        SocialCaseDerivation.id == derivation_id).first()
+    result = await db.execute(select(SocialCaseDerivation).filter(
+        SocialCaseDerivation.id == derivation_id))
+    derivation = result.unique().scalars().first()
 
     if not derivation:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="No existe una derivación con este id: %s" % format(derivation_id))
 
-    professionals = []
-
-    for i in derivation.assigned_professionals:
-        contact = fetch_users_service(req, i.user_id)
-        professionals.append(contact)
+    contacts = await run_in_threadpool(
+        fetch_users_batch, req, [i.user_id for i in derivation.assigned_professionals])
+    professionals = [contacts[i.user_id]
+                     for i in derivation.assigned_professionals]
 
     return {**derivation.__dict__,
             "assigned_professionals": professionals}
 
 
-@router.post("/{id}/close", response_model=ClosingItem)
+@router.post("/{id}/close", response_model=ClosingItem, dependencies=[Depends(QueryBudget(statements=8))])
 def close_case(req: Request,
                id: int,
                body: ClosingCreate,
+               background_tasks: BackgroundTasks,
                db: Session = Depends(get_database)):
     """
     Cierra un caso social
@@ -265,22 +345,20 @@ def close_case(req: Request,
 
     db_status = SocialCaseClose(**status)
 
-    db.add(db_status)
-    db.commit()
-    db.refresh(db_status)
-
-    social_case.closing_id = db_status.id
-    social_case.state = "CERRADO"
+    social_case.closing = db_status
+    set_case_state(db, social_case, "CERRADO")
 
     db.add(social_case)
-    db.commit()
-    db.refresh(social_case)
 
-    employee_cases = db.query(SocialCase).filter(and_(SocialCase.is_active == True,
-                                                      SocialCase.employee_id == social_case.employee_id, SocialCase.state != "CERRADO")).first()
+    employee_cases = db.query(SocialCase.id).filter(and_(SocialCase.is_active == True,  # noqa: E712
+                                                         SocialCase.employee_id == social_case.employee_id, SocialCase.state != "CERRADO", SocialCase.id != social_case.id)).first()
 
-    patch_employee_status(req, social_case.employee_id, {
-                          "has_social_case": bool(employee_cases)})
+    employee_id = social_case.employee_id
+    enqueue_employee_status(db, employee_id, {
+                            "has_social_case": bool(employee_cases)})
+    db.commit()
+
+    background_tasks.add_task(dispatch_employee_status, req.token, retries=False, employee_ids=[employee_id])
 
     return db_status
 
@@ -333,6 +411,7 @@ def update_derivation(req: Request, id: int, body: DerivationCreate, db: Session
     professionals = body.assigned_professionals
 
     create_professionals(db, professionals, edited_social_case_service['id'],  user_id)
+    db.commit()
 
 @router.post("/mail/social-case")
 def send_social_case_mail(type: str, body: SocialCaseMail = None):
@@ -147,10 +147,18 @@ class SocialCaseSimple(BaseModel):
         orm_mode = True
         allow_population_by_field_name = True
 
+
+class SocialCaseCollect(BaseModel):
+    employee_ids: List[int] = Field(alias="employeeIds")
+
+    class Config:
+        allow_population_by_field_name = True
+
+
 class SocialCaseDetails(SocialCaseItem):
     business: BussinessResponse
     employee: EmployeeResponse
-    area: AreaResponse
+    area: Optional[AreaResponse]
     professional: User
     asistencia: str = Field(alias="observation")
     tema: TemaResponse
@@ -180,3 +188,15 @@ class SocialCaseMail(BaseModel):
     derivationComment: Optional[str]
     profesionalDerivatedList: Optional[List[str]]
     derivatedType: Optional[str]
+
+
+class ImportRowError(BaseModel):
+    row: int
+    errors: List[dict]
+
+
+class ImportResult(BaseModel):
+    imported: int
+    failed: int
+    employees: int
+    errors: List[ImportRowError]
@@ -1,34 +1,458 @@
-from typing import List
+import codecs
+import csv
+import io
+import json
+import psycopg2
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import IO, Iterable, Iterator, List, Optional, Set, Tuple
 from fastapi import Request
 from fastapi.encoders import jsonable_encoder
+from pydantic import ValidationError
+from pydantic.fields import SHAPE_SINGLETON
+from sqlalchemy import exists, insert
+from sqlalchemy.future import select
+from sqlalchemy.orm import Query, aliased, noload, selectinload
 from sqlalchemy.orm.session import Session
-from .schema import AssignedProfessional as ProfessionalSchema
-from .model import AssignedProfessional
-from app.settings import SERVICES
-from ...helpers.fetch_data import fetch_service, handle_request
+from sqlalchemy.sql.elements import and_
+from sqlalchemy.sql.functions import func
+from sqlalchemy.sql.sqltypes import DateTime, String
+from .schema import AssignedProfessional as ProfessionalSchema, SocialCaseCreate, SocialCaseItem
+from .model import AssignedProfessional, EmployeeStatusOutbox, SocialCase
+from app.settings import SERVICES, OUTBOX_BATCH_SIZE, OUTBOX_MAX_ATTEMPTS, OUTBOX_LEASE_SECONDS, IMPORT_BATCH_SIZE, IMPORT_MAX_ERRORS, EXPORT_BATCH_SIZE
+from app.database.main import SessionLocal
+from ..dashboard.services import apply_counter_deltas
+from ...helpers.fetch_data import fetch_service, handle_request, invalidate_reference_data
+from ...helpers.filters import FilterSet
+from ...helpers.search import is_rut, normalize_rut
 
+COPY_COLUMNS = ("date", "assistance_id", "professional_id", "employee_rut", "employee_id",
+                "employee_names", "business_id", "business_name", "construction_id",
+                "construction_name", "area_id", "request_type", "derivation_state",
+                "assistance_derivation_id", "state", "is_active", "created_by")
 
-def create_professionals(db: Session, list: List[ProfessionalSchema], derivation_id: int, user_id: int):
+EXPORT_COLUMNS = (SocialCase.id, SocialCase.date, SocialCase.assistance_id, SocialCase.professional_id,
+                  SocialCase.employee_rut, SocialCase.employee_id, SocialCase.employee_names,
+                  SocialCase.business_id, SocialCase.business_name, SocialCase.construction_id,
+                  SocialCase.construction_name, SocialCase.area_id, SocialCase.request_type,
+                  SocialCase.derivation_state, SocialCase.state, SocialCase.is_active,
+                  SocialCase.derivation_id, SocialCase.created_at)
+
+EXPORT_MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+# last_error de los cambios del outbox reemplazados por uno más nuevo
+OUTBOX_SUPERSEDED = "Reemplazado por un cambio posterior"
+
+# Sin FORCE_NOT_NULL COPY lee los textos vacíos como NULL
+COPY_SQL = "COPY social_case (%s) FROM STDIN WITH (FORMAT csv, FORCE_NOT_NULL (%s))" % (
+    ", ".join(COPY_COLUMNS), "employee_rut, employee_names, request_type, state")
+
+
+def get_professional_rows(list: List[ProfessionalSchema], user_id: int) -> List[dict]:
+    rows = []
     for i in list:
         new_item = jsonable_encoder(i, by_alias=False)
-        new_item["derivation_id"] = derivation_id
         new_item["created_by"] = user_id
+        rows.append(new_item)
+
+    return rows
+
 
-        db_item = AssignedProfessional(**new_item)
+def build_professionals(list: List[ProfessionalSchema], user_id: int) -> List[AssignedProfessional]:
+    """
+    Profesionales asignados para agregar a una derivación nueva, se
+    insertan en lote al confirmar la transacción
+    """
+    return [AssignedProfessional(**row) for row in get_professional_rows(list, user_id)]
 
-        db.add(db_item)
-        db.commit()
-        db.refresh(db_item)
+
+def create_professionals(db: Session, list: List[ProfessionalSchema], derivation_id: int, user_id: int):
+    """
+    Inserta los profesionales asignados de una derivación existente en una
+    sola sentencia, sin confirmar la transacción
+    """
+    rows = [{**row, "derivation_id": derivation_id} for row in get_professional_rows(list, user_id)]
+    if rows:
+        db.execute(insert(AssignedProfessional).values(rows))
+
+
+def get_case_filters(business_id: Optional[int], start_date: Optional[datetime], end_date: Optional[datetime],
+                     state: Optional[str], assistance_id: Optional[int], professional_id: Optional[int],
+                     area_id: Optional[int], search: Optional[str]) -> tuple:
+    """
+    Condición de los filtros de la lista de casos sociales y, si la
+    búsqueda es por texto, la expresión de relevancia para ordenar.
+    Todos los filtros informados deben cumplirse.
+    """
+    filters = FilterSet().equals(SocialCase.business_id, business_id).equals(
+        SocialCase.area_id, area_id).equals(SocialCase.state, state).date_range(
+            SocialCase.date, start_date, end_date)
+
+    # El profesional puede ser el responsable o uno de los derivados
+    for user_id in (professional_id, assistance_id):
+        filters.any_of(user_id, SocialCase.professional_id == user_id,
+                       SocialCase.assistance_derivation_id.contains([user_id]))
+
+    if search and is_rut(search):
+        filters.add(SocialCase.employee_rut_normalized.like("{}%".format(normalize_rut(search))))
+    else:
+        filters.search(SocialCase.search_vector, search)
+
+    return filters.condition(), filters.rank
+
+
+def get_collect_query(employee_ids: List[int]):
+    """
+    Casos activos de los trabajadores con sus planes. Los planes se cargan
+    con un segundo SELECT ... IN para no multiplicar las filas de cada caso.
+    """
+    return select(SocialCase).filter(
+        SocialCase.is_active == True, SocialCase.employee_id.in_(employee_ids)).options(  # noqa: E712
+        selectinload(SocialCase.intervention_plans), noload(SocialCase.closing)).order_by(
+            SocialCase.employee_id, SocialCase.created_at, SocialCase.id)
 
 
 def get_assistance(req: Request, id: int):
     return fetch_service(req.token, SERVICES["assistance"]+"/assistance/"+str(id))
 
 
-def patch_employee_status(req, employee_id: int, body):
-    print(body)
-
-    handle_request(req.token, SERVICES["employees"] +
+def patch_employee_status(token: str, employee_id: int, body):
+    handle_request(token, SERVICES["employees"] +
                    "/employees/"+str(employee_id),
                    body,
                    "PATCH",)
+    invalidate_reference_data("employees", (employee_id,))
+
+
+def supersede_employee_status(db: Session, employee_ids: Iterable[int]):
+    """
+    Da por procesados los cambios pendientes anteriores de los trabajadores,
+    solo el último debe enviarse. Un cambio que se está enviando no se
+    reintenta, y el nuevo espera a que termine (ver `dispatch_employee_status`).
+    """
+    db.query(EmployeeStatusOutbox).filter(
+        EmployeeStatusOutbox.employee_id.in_(employee_ids),
+        EmployeeStatusOutbox.processed_at.is_(None)).update(
+            {"processed_at": func.now(), "last_error": OUTBOX_SUPERSEDED}, synchronize_session=False)
+
+
+def enqueue_employee_status(db: Session, employee_id: int, body):
+    """
+    Registra el cambio de estado del trabajador en el outbox, se confirma
+    junto con la transacción del caso
+    """
+    supersede_employee_status(db, [employee_id])
+    db.add(EmployeeStatusOutbox(employee_id=employee_id, payload=body))
+
+
+def enqueue_employee_statuses(db: Session, employee_ids: Set[int], body):
+    """
+    Registra en el outbox el mismo cambio de estado para varios
+    trabajadores en una sola sentencia
+    """
+    if employee_ids:
+        supersede_employee_status(db, sorted(employee_ids))
+        db.execute(insert(EmployeeStatusOutbox).values(
+            [{"employee_id": employee_id, "payload": body} for employee_id in sorted(employee_ids)]))
+
+
+def has_newer_status():
+    newer = aliased(EmployeeStatusOutbox)
+    return exists().where(and_(newer.employee_id == EmployeeStatusOutbox.employee_id,
+                               newer.processed_at.is_(None), newer.id > EmployeeStatusOutbox.id))
+
+
+def has_status_in_flight(now: datetime):
+    claimed = aliased(EmployeeStatusOutbox)
+    return exists().where(and_(claimed.employee_id == EmployeeStatusOutbox.employee_id,
+                               claimed.claimed_until > now))
+
+
+def claim_employee_statuses(db: Session, limit: int, retries: bool,
+                            employee_ids: Optional[List[int]]) -> List[Tuple[int, int, dict]]:
+    """
+    Reserva hasta `limit` cambios por OUTBOX_LEASE_SECONDS y confirma, así
+    el envío no mantiene filas bloqueadas. Por trabajador solo se toma el
+    último cambio pendiente y ninguno mientras otro suyo se está enviando,
+    para que los cambios lleguen en orden.
+    """
+    now = datetime.now(timezone.utc)
+    pending = EmployeeStatusOutbox.processed_at.is_(None)
+
+    # Cambios anteriores que quedaron pendientes por dos registros
+    # concurrentes del mismo trabajador
+    stale = select(EmployeeStatusOutbox.id).where(pending, has_newer_status()).with_for_update(
+        skip_locked=True).scalar_subquery()
+    db.query(EmployeeStatusOutbox).filter(EmployeeStatusOutbox.id.in_(stale)).update(
+        {"processed_at": now, "last_error": OUTBOX_SUPERSEDED}, synchronize_session=False)
+
+    query = db.query(EmployeeStatusOutbox).filter(
+        pending, EmployeeStatusOutbox.next_attempt_at <= now, ~has_newer_status(), ~has_status_in_flight(now))
+    if not retries:
+        query = query.filter(EmployeeStatusOutbox.attempts == 0)
+    if employee_ids is not None:
+        query = query.filter(EmployeeStatusOutbox.employee_id.in_(employee_ids))
+    events = query.order_by(EmployeeStatusOutbox.id).limit(limit).with_for_update(skip_locked=True).all()
+
+    claimed = []
+    for event in events:
+        event.claimed_until = now + timedelta(seconds=OUTBOX_LEASE_SECONDS)
+        claimed.append((event.id, event.employee_id, event.payload))
+    db.commit()
+    return claimed
+
+
+def finish_employee_status(db: Session, id: int, error: Optional[str]):
+    """
+    Libera el cambio enviado y lo da por procesado, o programa su reintento
+    si falló. Un cambio reemplazado mientras se enviaba no se reintenta.
+    """
+    now = datetime.now(timezone.utc)
+    event = db.query(EmployeeStatusOutbox).filter(EmployeeStatusOutbox.id == id).with_for_update().one()
+    event.claimed_until = None
+    if event.processed_at is None:
+        if error is None:
+            event.processed_at = now
+        else:
+            event.attempts += 1
+            event.last_error = error
+            # Se descarta tras OUTBOX_MAX_ATTEMPTS, queda con last_error
+            if event.attempts >= OUTBOX_MAX_ATTEMPTS:
+                event.processed_at = now
+            else:
+                event.next_attempt_at = now + timedelta(seconds=min(2 ** event.attempts, 600))
+    db.commit()
+
+
+def dispatch_employee_status(token: str, limit: int = OUTBOX_BATCH_SIZE, retries: bool = True,
+                             employee_ids: Optional[List[int]] = None) -> int:
+    """
+    Envía al servicio de trabajadores los cambios pendientes del outbox.
+    El PATCH es absoluto y puede repetirse sin efectos adicionales.
+    ---
+    - **token**: credencial con la que se envían los cambios
+    - **retries**: False para enviar solo los cambios que no han fallado,
+    los reintentos quedan a cargo del despachador periódico
+    - **employee_ids**: limita el envío a estos trabajadores, para enviar
+    con el token de un usuario solo los cambios de su request
+    """
+    db = SessionLocal()
+    try:
+        events = claim_employee_statuses(db, limit, retries, employee_ids)
+        for id, employee_id, payload in events:
+            try:
+                patch_employee_status(token, employee_id, payload)
+                error = None
+            except Exception as exception:
+                error = str(getattr(exception, "detail", exception))[:500]
+            finish_employee_status(db, id, error)
+        return len(events)
+    finally:
+        db.close()
+
+
+def dispatch_new_employee_statuses(token: str, employee_ids: Iterable[int],
+                                   batch_size: int = OUTBOX_BATCH_SIZE) -> int:
+    """
+    Envía en lotes de `batch_size` trabajadores los cambios nuevos de
+    `employee_ids`, usado después de una carga masiva
+    """
+    employee_ids = sorted(employee_ids)
+    total = 0
+    for i in range(0, len(employee_ids), batch_size):
+        total += dispatch_employee_status(token, batch_size, retries=False,
+                                          employee_ids=employee_ids[i:i + batch_size])
+    return total
+
+
+def read_ndjson_rows(file: IO[bytes]) -> Iterator[Tuple[int, object]]:
+    for number, line in enumerate(codecs.iterdecode(file, "utf-8-sig"), start=1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError:
+            yield number, None
+
+
+def read_csv_rows(file: IO[bytes]) -> Iterator[Tuple[int, object]]:
+    """
+    La primera fila son los nombres de las columnas (alias o nombres del
+    modelo). Las celdas vacías se omiten y las listas se separan con "|".
+    """
+    lists = {name for field in SocialCaseCreate.__fields__.values() if field.shape != SHAPE_SINGLETON
+             for name in (field.name, field.alias)}
+    reader = csv.DictReader(codecs.iterdecode(file, "utf-8-sig"))
+    for number, row in enumerate(reader, start=1):
+        yield number, {key: value.split("|") if key in lists else value
+                       for key, value in row.items() if key and value not in (None, "")}
+
+
+def format_copy_value(value) -> object:
+    if isinstance(value, list):
+        return "{%s}" % ",".join(str(i) for i in value)
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    return value
+
+
+def get_column_lengths() -> dict:
+    return {column: SocialCase.__table__.c[column].type.length for column in COPY_COLUMNS
+            if isinstance(SocialCase.__table__.c[column].type, String)}
+
+
+COLUMN_LENGTHS = get_column_lengths()
+
+
+def check_column_lengths(case: SocialCaseCreate) -> List[dict]:
+    """
+    Errores, en el formato de pydantic, de los textos que no caben en su
+    columna. Sin esta validación la fila haría fallar el COPY completo.
+    """
+    errors = []
+    for column, length in COLUMN_LENGTHS.items():
+        value = getattr(case, column, None)
+        if isinstance(value, str) and len(value) > length:
+            errors.append({"loc": [SocialCaseCreate.__fields__[column].alias],
+                           "msg": "ensure this value has at most %s characters" % length,
+                           "type": "value_error.any_str.max_length",
+                           "ctx": {"limit_value": length}})
+    return errors
+
+
+def copy_cases(db: Session, cases: List[SocialCaseCreate], user_id: int):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    deltas = Counter()
+    for case in cases:
+        row = {**case.dict(), "state": "SOLICITADO", "is_active": True, "created_by": user_id}
+        writer.writerow([format_copy_value(row[column]) for column in COPY_COLUMNS])
+        deltas[(case.business_id or 0, case.area_id, "SOLICITADO")] += 1
+
+    buffer.seek(0)
+    with db.connection().connection.cursor() as cursor:
+        cursor.copy_expert(COPY_SQL, buffer)
+    apply_counter_deltas(db, deltas)
+
+
+def get_copy_error(number: int, error: Exception) -> dict:
+    return {"row": number, "errors": [{"msg": str(error).strip().split("\n")[0], "type": "database_error"}]}
+
+
+def copy_batch(db: Session, batch: List[Tuple[int, SocialCaseCreate]], user_id: int) -> List[dict]:
+    """
+    Carga el lote en un savepoint. Si la base rechaza el lote se carga de
+    a una fila para informar solo las que fallan. Retorna los errores.
+    """
+    try:
+        with db.begin_nested():
+            copy_cases(db, [case for _, case in batch], user_id)
+        return []
+    except (psycopg2.DataError, psycopg2.IntegrityError) as error:
+        if len(batch) == 1:
+            return [get_copy_error(batch[0][0], error)]
+
+    errors = []
+    for number, case in batch:
+        try:
+            with db.begin_nested():
+                copy_cases(db, [case], user_id)
+        except (psycopg2.DataError, psycopg2.IntegrityError) as error:
+            errors.append(get_copy_error(number, error))
+    return errors
+
+
+def import_social_cases(db: Session, file: IO[bytes], format: str, user_id: int) -> dict:
+    """
+    Valida las filas contra SocialCaseCreate y el largo de las columnas en
+    lotes de IMPORT_BATCH_SIZE y carga las válidas con COPY. Todo se
+    confirma en una transacción; los trabajadores afectados se registran
+    una sola vez en el outbox al final y se retornan en `employee_ids`.
+    """
+    rows = read_csv_rows(file) if format == "csv" else read_ndjson_rows(file)
+    imported = 0
+    errors = []
+    failed = 0
+    employee_ids = set()
+    batch = []
+
+    def add_errors(row_errors: List[dict]):
+        nonlocal failed
+        failed += len(row_errors)
+        errors.extend(row_errors[:max(0, IMPORT_MAX_ERRORS - len(errors))])
+
+    def flush():
+        nonlocal imported
+        batch_errors = copy_batch(db, batch, user_id)
+        add_errors(batch_errors)
+        rejected = {error["row"] for error in batch_errors}
+        loaded = [case for number, case in batch if number not in rejected]
+        imported += len(loaded)
+        employee_ids.update(case.employee_id for case in loaded)
+        batch.clear()
+
+    for number, data in rows:
+        try:
+            if not isinstance(data, dict):
+                raise ValueError("Fila inválida")
+            case = SocialCaseCreate.parse_obj(data)
+        except (ValidationError, ValueError) as error:
+            details = error.errors() if isinstance(error, ValidationError) else [{"msg": str(error)}]
+            add_errors([{"row": number, "errors": details}])
+            continue
+
+        length_errors = check_column_lengths(case)
+        if length_errors:
+            add_errors([{"row": number, "errors": length_errors}])
+            continue
+
+        batch.append((number, case))
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            flush()
+
+    if batch:
+        flush()
+
+    enqueue_employee_statuses(db, employee_ids, {"has_social_case": True})
+    db.commit()
+
+    return {"imported": imported, "failed": failed, "errors": errors, "employees": len(employee_ids),
+            "employee_ids": employee_ids}
+
+
+def stream_cases(query: Query, format: str) -> Iterator[bytes]:
+    """
+    Genera el archivo de exportación por bloques. La consulta se lee con un
+    cursor del servidor de a EXPORT_BATCH_SIZE filas, la memoria no depende
+    del total de filas.
+    """
+    names = [SocialCaseItem.__fields__[column.key].alias if column.key in SocialCaseItem.__fields__
+             else column.key for column in EXPORT_COLUMNS]
+    dates = [index for index, column in enumerate(EXPORT_COLUMNS) if isinstance(column.type, DateTime)]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    # La cabecera sale antes de ejecutar la consulta
+    if format == "csv":
+        writer.writerow(names)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+
+    rows = query.execution_options(stream_results=True).yield_per(EXPORT_BATCH_SIZE)
+    for number, row in enumerate(rows, start=1):
+        values = list(row)
+        for index in dates:
+            if values[index] is not None:
+                values[index] = values[index].isoformat()
+        if format == "csv":
+            writer.writerow(values)
+        else:
+            buffer.write(json.dumps(dict(zip(names, values)), ensure_ascii=False) + "\n")
+
+        if number % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue().encode()
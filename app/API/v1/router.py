@@ -5,9 +5,11 @@ from .middlewares.auth import JWTBearer
 from ..v1.modules.social_cases.routes import router as social_cases_routes
 from ..v1.modules.intervention_plans.routes import router as plans_routes
 from ..v1.modules.dashboard.routes import router as dashboard_routes
+from ..v1.modules.metrics.routes import router as metrics_routes
 
 router = APIRouter(dependencies=[Depends(JWTBearer())])
 
 router.include_router(social_cases_routes)
 router.include_router(plans_routes)
 router.include_router(dashboard_routes)
+router.include_router(metrics_routes)
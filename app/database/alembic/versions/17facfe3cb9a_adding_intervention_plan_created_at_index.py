@@ -0,0 +1,28 @@
+"""adding intervention plan created_at index
+
+Revision ID: 17facfe3cb9a
+Revises: c1774a9b5340
+Create Date: 2026-10-18 14:41:37.220518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '17facfe3cb9a'
+down_revision = 'c1774a9b5340'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index('ix_intervention_plan_created_at', 'intervention_plan', ['created_at', 'id'],
+                        unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_intervention_plan_created_at', table_name='intervention_plan',
+                      postgresql_concurrently=True)
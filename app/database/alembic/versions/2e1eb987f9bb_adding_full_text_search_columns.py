@@ -0,0 +1,112 @@
+"""adding full text search columns
+
+Revision ID: 2e1eb987f9bb
+Revises: 17facfe3cb9a
+Create Date: 2026-10-18 15:10:52.663104
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '2e1eb987f9bb'
+down_revision = '17facfe3cb9a'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 5000
+
+# (tabla, función del trigger, columnas de origen, [(columna, expresión)])
+SEARCH_TRIGGERS = [
+    ('social_case', 'social_case_search_columns', ['employee_rut', 'employee_names', 'business_name'], [
+        ('employee_rut_normalized', "regexp_replace(upper(%(row)semployee_rut), '[^0-9K]', '', 'g')"),
+        ('search_vector', "to_tsvector('es_unaccent', coalesce(%(row)semployee_names, '') || ' ' || "
+                          "coalesce(%(row)sbusiness_name, ''))"),
+    ]),
+    ('intervention_plan', 'intervention_plan_search_columns', ['management_name', 'professional_names'], [
+        ('search_vector', "to_tsvector('es_unaccent', coalesce(%(row)smanagement_name, '') || ' ' || "
+                          "coalesce(%(row)sprofessional_names, ''))"),
+    ]),
+]
+
+TRIGRAM_INDEXES = [
+    ('ix_social_case_employee_rut_trgm', 'employee_rut'),
+    ('ix_social_case_employee_names_trgm', 'employee_names'),
+    ('ix_social_case_business_name_trgm', 'business_name'),
+]
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS unaccent')
+    # Configuración en español que ignora tildes, to_tsvector con una
+    # configuración fija es inmutable y puede usarse en índices
+    op.execute("""
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'es_unaccent') THEN
+                CREATE TEXT SEARCH CONFIGURATION es_unaccent (COPY = spanish);
+                ALTER TEXT SEARCH CONFIGURATION es_unaccent
+                    ALTER MAPPING FOR hword, hword_part, word WITH unaccent, spanish_stem;
+            END IF;
+        END
+        $$
+    """)
+
+    # Columnas sin default y mantenidas por trigger en vez de columnas
+    # generadas STORED, que reescriben la tabla con ACCESS EXCLUSIVE
+    op.add_column('social_case', sa.Column('employee_rut_normalized', sa.String(length=12), nullable=True))
+    op.add_column('social_case', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+    op.add_column('intervention_plan', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+    for table, function, columns, values in SEARCH_TRIGGERS:
+        op.execute("""
+            CREATE OR REPLACE FUNCTION %s() RETURNS trigger AS $$
+            BEGIN
+                %s
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql
+        """ % (function, " ".join("NEW.%s := %s;" % (column, value % {"row": "NEW."}) for column, value in values)))
+        op.execute("CREATE TRIGGER %s BEFORE INSERT OR UPDATE OF %s ON %s FOR EACH ROW EXECUTE PROCEDURE %s()" % (
+            function, ", ".join(columns), table, function))
+
+    # Relleno por lotes, cada uno en su propia transacción
+    with op.get_context().autocommit_block():
+        for table, function, columns, values in SEARCH_TRIGGERS:
+            max_id = op.get_bind().execute(sa.text("SELECT coalesce(max(id), 0) FROM %s" % table)).scalar()
+            for start in range(0, max_id, BACKFILL_BATCH_SIZE):
+                op.execute("UPDATE %s SET %s WHERE id > %s AND id <= %s" % (
+                    table, ", ".join("%s = %s" % (column, value % {"row": ""}) for column, value in values),
+                    start, start + BACKFILL_BATCH_SIZE))
+
+        op.create_index('ix_social_case_employee_rut_normalized', 'social_case', ['employee_rut_normalized'],
+                        unique=False, postgresql_concurrently=True,
+                        postgresql_ops={'employee_rut_normalized': 'text_pattern_ops'})
+        op.create_index('ix_social_case_search_vector', 'social_case', ['search_vector'],
+                        unique=False, postgresql_concurrently=True, postgresql_using='gin')
+        op.create_index('ix_intervention_plan_search_vector', 'intervention_plan', ['search_vector'],
+                        unique=False, postgresql_concurrently=True, postgresql_using='gin')
+        # La búsqueda ya no usa ilike, los índices trigram solo agregan costo de escritura
+        for name, column in TRIGRAM_INDEXES:
+            op.drop_index(name, table_name='social_case', postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, column in TRIGRAM_INDEXES:
+            op.create_index(name, 'social_case', [column], unique=False, postgresql_concurrently=True,
+                            postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'})
+        op.drop_index('ix_intervention_plan_search_vector', table_name='intervention_plan',
+                      postgresql_concurrently=True)
+        op.drop_index('ix_social_case_search_vector', table_name='social_case', postgresql_concurrently=True)
+        op.drop_index('ix_social_case_employee_rut_normalized', table_name='social_case',
+                      postgresql_concurrently=True)
+
+    for table, function, columns, values in SEARCH_TRIGGERS:
+        op.execute("DROP TRIGGER IF EXISTS %s ON %s" % (function, table))
+        op.execute("DROP FUNCTION IF EXISTS %s()" % function)
+    op.drop_column('intervention_plan', 'search_vector')
+    op.drop_column('social_case', 'search_vector')
+    op.drop_column('social_case', 'employee_rut_normalized')
+    op.execute('DROP TEXT SEARCH CONFIGURATION IF EXISTS es_unaccent')
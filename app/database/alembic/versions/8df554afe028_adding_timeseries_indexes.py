@@ -0,0 +1,35 @@
+"""adding timeseries indexes
+
+Revision ID: 8df554afe028
+Revises: 4334f0cd0415
+Create Date: 2026-10-18 16:48:09.512730
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8df554afe028'
+down_revision = '4334f0cd0415'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_social_case_derivation_id', 'social_case', ['derivation_id']),
+    ('ix_social_case_closing_id', 'social_case', ['closing_id']),
+    ('ix_social_case_derivation_created_at', 'social_case_derivation', ['created_at']),
+    ('ix_social_case_close_created_at', 'social_case_close', ['created_at']),
+]
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
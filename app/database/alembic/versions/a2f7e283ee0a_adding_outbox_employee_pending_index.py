@@ -0,0 +1,29 @@
+"""adding outbox employee pending index
+
+Revision ID: a2f7e283ee0a
+Revises: 8df554afe028
+Create Date: 2026-10-18 13:57:19.430536
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a2f7e283ee0a'
+down_revision = '8df554afe028'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index('ix_employee_status_outbox_employee_pending', 'employee_status_outbox', ['employee_id'],
+                        unique=False, postgresql_where=sa.text('processed_at IS NULL'),
+                        postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_employee_status_outbox_employee_pending', table_name='employee_status_outbox',
+                      postgresql_concurrently=True)
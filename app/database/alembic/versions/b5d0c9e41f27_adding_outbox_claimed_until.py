@@ -0,0 +1,32 @@
+"""adding outbox claimed until
+
+Revision ID: b5d0c9e41f27
+Revises: a2f7e283ee0a
+Create Date: 2026-10-18 16:12:03.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5d0c9e41f27'
+down_revision = 'a2f7e283ee0a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Columna nullable sin default, no reescribe la tabla
+    op.add_column('employee_status_outbox', sa.Column('claimed_until', sa.DateTime(timezone=True), nullable=True))
+    with op.get_context().autocommit_block():
+        op.create_index('ix_employee_status_outbox_employee_claimed', 'employee_status_outbox', ['employee_id'],
+                        unique=False, postgresql_where=sa.text('claimed_until IS NOT NULL'),
+                        postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_employee_status_outbox_employee_claimed', table_name='employee_status_outbox',
+                      postgresql_concurrently=True)
+    op.drop_column('employee_status_outbox', 'claimed_until')
@@ -0,0 +1,68 @@
+"""adding social case and intervention plan indexes
+
+Revision ID: c1774a9b5340
+Revises: 5749245bedec
+Create Date: 2026-10-18 14:02:11.408153
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c1774a9b5340'
+down_revision = '5749245bedec'
+branch_labels = None
+depends_on = None
+
+SOCIAL_CASE_INDEXES = [
+    ('ix_social_case_created_at', [sa.text('created_at DESC')], {}),
+    ('ix_social_case_business_created_at', ['business_id', sa.text('created_at DESC')], {}),
+    ('ix_social_case_business_construction_created_at',
+     ['business_id', 'construction_id', sa.text('created_at DESC')], {}),
+    ('ix_social_case_professional_created_at', ['professional_id', sa.text('created_at DESC')], {}),
+    ('ix_social_case_area_created_at', ['area_id', sa.text('created_at DESC')], {}),
+    ('ix_social_case_state_created_at', ['state', sa.text('created_at DESC')], {}),
+    ('ix_social_case_date', ['date'], {}),
+    ('ix_social_case_employee_active', ['employee_id', 'created_at'],
+     {'postgresql_where': sa.text('is_active = true')}),
+    ('ix_social_case_assistance_derivation_id', ['assistance_derivation_id'],
+     {'postgresql_using': 'gin'}),
+    ('ix_social_case_employee_rut_trgm', ['employee_rut'],
+     {'postgresql_using': 'gin', 'postgresql_ops': {'employee_rut': 'gin_trgm_ops'}}),
+    ('ix_social_case_employee_names_trgm', ['employee_names'],
+     {'postgresql_using': 'gin', 'postgresql_ops': {'employee_names': 'gin_trgm_ops'}}),
+    ('ix_social_case_business_name_trgm', ['business_name'],
+     {'postgresql_using': 'gin', 'postgresql_ops': {'business_name': 'gin_trgm_ops'}}),
+]
+
+INTERVENTION_PLAN_INDEXES = [
+    ('ix_intervention_plan_social_case_id', ['social_case_id'], {}),
+    ('ix_intervention_plan_professional_next_date', ['professional_id', 'next_date'],
+     {'postgresql_where': sa.text('is_active = true')}),
+    ('ix_intervention_plan_next_date', ['next_date'],
+     {'postgresql_where': sa.text('is_active = true')}),
+]
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # La columna existe en el modelo pero ninguna migración anterior la crea
+    op.execute('ALTER TABLE social_case ADD COLUMN IF NOT EXISTS assistance_derivation_id integer[]')
+
+    # CONCURRENTLY evita bloquear escrituras mientras se construyen los índices
+    with op.get_context().autocommit_block():
+        for name, columns, options in SOCIAL_CASE_INDEXES:
+            op.create_index(name, 'social_case', columns, unique=False,
+                            postgresql_concurrently=True, **options)
+        for name, columns, options in INTERVENTION_PLAN_INDEXES:
+            op.create_index(name, 'intervention_plan', columns, unique=False,
+                            postgresql_concurrently=True, **options)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, columns, options in INTERVENTION_PLAN_INDEXES:
+            op.drop_index(name, table_name='intervention_plan', postgresql_concurrently=True)
+        for name, columns, options in SOCIAL_CASE_INDEXES:
+            op.drop_index(name, table_name='social_case', postgresql_concurrently=True)
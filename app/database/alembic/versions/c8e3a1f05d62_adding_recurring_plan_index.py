@@ -0,0 +1,29 @@
+"""adding recurring plan index
+
+Revision ID: c8e3a1f05d62
+Revises: b5d0c9e41f27
+Create Date: 2026-10-18 18:05:41.502317
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8e3a1f05d62'
+down_revision = 'b5d0c9e41f27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index('ix_intervention_plan_recurring_next_date', 'intervention_plan',
+                        [sa.text('upper(frequency)'), 'next_date'], unique=False,
+                        postgresql_where=sa.text('is_active = true'), postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_intervention_plan_recurring_next_date', table_name='intervention_plan',
+                      postgresql_concurrently=True)
@@ -1,4 +1,5 @@
 from .base_class import Base
 
-from ..API.v1.modules.social_cases.model import SocialCase, SocialCaseDerivation, AssignedProfessional, SocialCaseClose
+from ..API.v1.modules.social_cases.model import SocialCase, SocialCaseDerivation, AssignedProfessional, SocialCaseClose, EmployeeStatusOutbox
 from ..API.v1.modules.intervention_plans.model import InterventionPlan
+from ..API.v1.modules.dashboard.model import CaseStateCounter
@@ -1,19 +1,62 @@
-from typing import Generator
-from sqlalchemy import create_engine
+from typing import AsyncGenerator, Generator, Hashable, Optional
+from fastapi import Request
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from app.settings import DATABASE_URL
+from app.settings import DATABASE_URL, ASYNC_DATABASE_URL, DATABASE_REPLICA_URLS, REPLICA_MAX_LAG, REPLICA_CHECK_INTERVAL, REPLICA_STICKY_SECONDS, REPLICA_CONNECT_TIMEOUT
+from .replicas import ReplicaSet
 
 engine = create_engine(DATABASE_URL, pool_pre_ping=True, pool_size=20)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_engine(ASYNC_DATABASE_URL, pool_pre_ping=True, pool_size=20)
+AsyncSessionLocal = sessionmaker(async_engine, class_=AsyncSession,
+                                 autoflush=False, expire_on_commit=False)
+
+replicas = ReplicaSet(DATABASE_REPLICA_URLS, REPLICA_MAX_LAG, REPLICA_CHECK_INTERVAL,
+                      REPLICA_STICKY_SECONDS, connect_timeout=REPLICA_CONNECT_TIMEOUT)
+
 Base = declarative_base()
 
 
-def get_database() -> Generator:
-    db = SessionLocal()
+def get_request_key(req: Optional[Request]) -> Optional[Hashable]:
+    auth = getattr(req.state, "auth", None) if req is not None else None
+    return auth.user_id if auth else None
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def pin_to_primary(session) -> None:
+    key = get_request_key(session.info.get("request"))
+    if key is not None:
+        replicas.pin(key)
+
 
+def get_database(req: Request = None) -> Generator:
+    db = SessionLocal(info={"request": req})
     try:
         yield db
     finally:
         db.close()
+
+
+def get_read_database(req: Request) -> Generator:
+    """
+    Sesión para endpoints de solo lectura, usa una réplica sana o el
+    primario si no hay ninguna o el usuario escribió hace poco
+    """
+    db = SessionLocal(bind=replicas.get_engine(engine, get_request_key(req)))
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_database() -> AsyncGenerator:
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_async_read_database(req: Request) -> AsyncGenerator:
+    async with AsyncSessionLocal(bind=replicas.get_async_engine(async_engine, get_request_key(req))) as db:
+        yield db
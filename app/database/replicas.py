@@ -0,0 +1,112 @@
+import itertools
+import time
+from threading import Lock
+from typing import Hashable, List, Optional
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from app.settings import to_async_url
+from app.API.v1.helpers.cache import TTLCache
+
+# Un servidor que no está en recuperación (o que ya aplicó todo lo recibido)
+# no tiene retraso aunque la última transacción sea antigua. Si la réplica
+# no está recibiendo del primario no se puede saber su retraso (NULL).
+LAG_QUERY = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN NULL
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+
+class Replica:
+    def __init__(self, url: str, pool_size: int, connect_timeout: int):
+        self.engine = create_engine(url, pool_pre_ping=True, pool_size=pool_size,
+                                    connect_args={"connect_timeout": connect_timeout})
+        self.async_engine = create_async_engine(to_async_url(url), pool_pre_ping=True, pool_size=pool_size,
+                                                connect_args={"timeout": connect_timeout})
+        self.name = self.engine.url.render_as_string(hide_password=True)
+        self.healthy = False
+        self.lag = None
+        self.error = None
+        self.checked_at = 0.0
+
+
+class ReplicaSet:
+    """
+    Elige la réplica para las lecturas. Una réplica se usa solo si su
+    último chequeo fue exitoso, reciente y con retraso bajo `max_lag`;
+    si ninguna cumple las lecturas vuelven al primario.
+
+    Los usuarios que acaban de escribir quedan fijados al primario durante
+    `sticky_seconds` para que lean sus propios cambios.
+    """
+
+    def __init__(self, urls: List[str], max_lag: float, check_interval: float,
+                 sticky_seconds: float, pool_size: int = 20, connect_timeout: int = 3):
+        self.replicas = [Replica(url, pool_size, connect_timeout) for url in urls]
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.pinned = TTLCache(ttl=sticky_seconds, max_size=10000)
+        self.primary_reads = 0
+        self.replica_reads = 0
+        self._cycle = itertools.cycle(self.replicas)
+        self._lock = Lock()
+
+    def check(self, replica: Replica) -> None:
+        try:
+            with replica.engine.connect() as conn:
+                lag = conn.execute(LAG_QUERY).scalar()
+            replica.lag = None if lag is None else float(lag)
+            replica.error = None if lag is not None else "WalReceiverNotStreaming"
+            replica.healthy = lag is not None and replica.lag <= self.max_lag
+        except SQLAlchemyError as error:
+            replica.lag = None
+            replica.error = type(error).__name__
+            replica.healthy = False
+        replica.checked_at = time.monotonic()
+
+    def check_all(self) -> None:
+        for replica in self.replicas:
+            self.check(replica)
+
+    def is_available(self, replica: Replica) -> bool:
+        # Si el chequeo periódico se detuvo la réplica deja de considerarse sana
+        return replica.healthy and time.monotonic() - replica.checked_at < self.check_interval * 3
+
+    def pin(self, key: Hashable) -> None:
+        self.pinned.set(key, True)
+
+    def choose(self, key: Optional[Hashable] = None) -> Optional[Replica]:
+        if not self.replicas or (key is not None and self.pinned.get(key)):
+            self.primary_reads += 1
+            return None
+
+        with self._lock:
+            for _ in range(len(self.replicas)):
+                replica = next(self._cycle)
+                if self.is_available(replica):
+                    self.replica_reads += 1
+                    return replica
+
+        self.primary_reads += 1
+        return None
+
+    def get_engine(self, primary: Engine, key: Optional[Hashable] = None) -> Engine:
+        replica = self.choose(key)
+        return replica.engine if replica else primary
+
+    def get_async_engine(self, primary: AsyncEngine, key: Optional[Hashable] = None) -> AsyncEngine:
+        replica = self.choose(key)
+        return replica.async_engine if replica else primary
+
+    def as_dict(self) -> dict:
+        return {"primaryReads": self.primary_reads,
+                "replicaReads": self.replica_reads,
+                "replicas": [{"name": replica.name,
+                              "healthy": self.is_available(replica),
+                              "lag": replica.lag,
+                              "error": replica.error} for replica in self.replicas]}
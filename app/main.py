@@ -1,8 +1,17 @@
+import asyncio
+import logging
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 
 from app.API.v1 import router as V1_Routes
-from app.database.main import get_database
+from app.database.main import get_database, replicas
+from app.settings import SERVICE_TOKEN, OUTBOX_BATCH_SIZE, OUTBOX_INTERVAL, REPLICA_CHECK_INTERVAL, COUNTERS_RECONCILE_INTERVAL, QUERY_BUDGET_MODE
+from app.API.v1.middlewares.query_budget import QueryBudgetMiddleware
+from app.API.v1.modules.social_cases.services import dispatch_employee_status
+from app.API.v1.modules.dashboard.services import reconcile_state_counters
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Servicio de Casos sociales")
 
@@ -16,7 +25,53 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
+if QUERY_BUDGET_MODE != "off":
+    app.add_middleware(QueryBudgetMiddleware)
+
 
 @app.on_event("startup")
 async def startup():
     get_database()
+    if SERVICE_TOKEN:
+        asyncio.create_task(dispatch_outbox())
+    else:
+        logger.warning("SERVICE_TOKEN no está configurado, los cambios fallidos del outbox no se reintentarán")
+    if replicas.replicas:
+        await run_in_threadpool(replicas.check_all)
+        asyncio.create_task(check_replicas())
+    asyncio.create_task(reconcile_counters())
+
+
+async def dispatch_outbox():
+    """
+    Único responsable de los reintentos del outbox, los requests solo
+    envían los cambios nuevos
+    """
+    while True:
+        try:
+            # Se vacía la cola antes de esperar el siguiente intervalo
+            while await run_in_threadpool(dispatch_employee_status, SERVICE_TOKEN) >= OUTBOX_BATCH_SIZE:
+                pass
+        except Exception:
+            logger.exception("Error al despachar outbox")
+        await asyncio.sleep(OUTBOX_INTERVAL)
+
+
+async def check_replicas():
+    while True:
+        await asyncio.sleep(REPLICA_CHECK_INTERVAL)
+        try:
+            await run_in_threadpool(replicas.check_all)
+        except Exception:
+            logger.exception("Error al chequear réplicas")
+
+
+async def reconcile_counters():
+    while True:
+        await asyncio.sleep(COUNTERS_RECONCILE_INTERVAL)
+        try:
+            drift = await run_in_threadpool(reconcile_state_counters)
+            if drift:
+                logger.warning("Contadores de casos corregidos: %s", drift)
+        except Exception:
+            logger.exception("Error al recalcular contadores")
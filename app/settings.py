@@ -44,6 +44,29 @@ services_hostnames = {
 
 DATABASE_URL = get_db_url(ENV)
 
+
+def to_async_url(url: str) -> str:
+    return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+
+
+def get_async_db_url(url: str) -> str:
+    if os.getenv("ASYNC_DATABASE_URL"):
+        return os.getenv("ASYNC_DATABASE_URL")
+    return to_async_url(url)
+
+
+ASYNC_DATABASE_URL = get_async_db_url(DATABASE_URL)
+
+# Réplicas de solo lectura separadas por coma, vacío para usar solo el primario
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+# Segundos de retraso de replicación tolerados antes de sacar una réplica
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", "5"))
+REPLICA_CHECK_INTERVAL = float(os.getenv("REPLICA_CHECK_INTERVAL", "5"))
+# Tras una escritura, las lecturas del mismo usuario van al primario este tiempo
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", "10"))
+# Segundos máximos para conectarse a una réplica, un host caído no detiene el chequeo
+REPLICA_CONNECT_TIMEOUT = int(os.getenv("REPLICA_CONNECT_TIMEOUT", "3"))
+
 SERVICES = {
     "parameters": services_hostnames["parameters"],
     "users": services_hostnames["users"],
@@ -53,3 +76,106 @@ SERVICES = {
     "housing": services_hostnames["vivienda"],
     "assistance": services_hostnames["assistance"],
 }
+
+SERVICES_TIMEOUT = float(os.getenv("SERVICES_TIMEOUT", "5"))
+SERVICES_POOL_SIZE = int(os.getenv("SERVICES_POOL_SIZE", "20"))
+SERVICES_CONCURRENCY = int(os.getenv("SERVICES_CONCURRENCY", "8"))
+# Ruta de consulta masiva de usuarios, ej: /users/bulk (vacío para deshabilitar)
+USERS_BULK_ENDPOINT = os.getenv("USERS_BULK_ENDPOINT", "")
+
+
+def get_service_config(service: str) -> dict:
+    prefix = "%s_SERVICE" % service.upper()
+    return {"connect_timeout": float(os.getenv(prefix + "_CONNECT_TIMEOUT", "1")),
+            "read_timeout": float(os.getenv(prefix + "_READ_TIMEOUT", "3")),
+            "retries": int(os.getenv(prefix + "_RETRIES", "2")),
+            "failure_threshold": int(os.getenv(prefix + "_FAILURE_THRESHOLD", "5")),
+            "reset_timeout": float(os.getenv(prefix + "_RESET_TIMEOUT", "30"))}
+
+
+SERVICES_CONFIG = {service: get_service_config(service) for service in SERVICES}
+# Reintentos permitidos por cada request exitoso (presupuesto de reintentos)
+RETRY_BUDGET_RATIO = float(os.getenv("RETRY_BUDGET_RATIO", "0.2"))
+RETRY_BACKOFF = float(os.getenv("RETRY_BACKOFF", "0.1"))
+
+JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY")
+# Conjunto de llaves en formato JSON {"kid": "secret"} para rotación
+JWT_KEYS = os.getenv("JWT_KEYS")
+JWT_ALGORITHMS = os.getenv("JWT_ALGORITHMS", "HS256").split(",")
+JWT_USER_CLAIM = os.getenv("JWT_USER_CLAIM", "id")
+
+AUTH_REMOTE_FALLBACK = os.getenv("AUTH_REMOTE_FALLBACK", "true").lower() == "true"
+AUTH_CACHE_TTL = int(os.getenv("AUTH_CACHE_TTL", "300"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+
+
+def get_cache_config(namespace: str, ttl: int, stale_ttl: int, max_size: int = 1000) -> dict:
+    prefix = "CACHE_%s" % namespace.upper()
+    return {"ttl": float(os.getenv(prefix + "_TTL", ttl)),
+            "stale_ttl": float(os.getenv(prefix + "_STALE_TTL", stale_ttl)),
+            "max_size": int(os.getenv(prefix + "_SIZE", max_size))}
+
+
+REFERENCE_CACHE = {
+    "parameters": get_cache_config("parameters", 3600, 3600),
+    "business": get_cache_config("business", 600, 600),
+    "users": get_cache_config("users", 600, 600),
+    "assistance": get_cache_config("assistance", 300, 300),
+    "employees": get_cache_config("employees", 60, 60, 5000),
+}
+# Namespaces cuyos datos no dependen del usuario y se comparten entre todos,
+# el resto se cachea por usuario
+REFERENCE_CACHE_SHARED = os.getenv("REFERENCE_CACHE_SHARED", "parameters").split(",")
+
+# Token de servicio usado por el despachador del outbox fuera de un request
+SERVICE_TOKEN = os.getenv("SERVICE_TOKEN")
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_INTERVAL = float(os.getenv("OUTBOX_INTERVAL", "10"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+# Tiempo que un cambio tomado por un despachador queda reservado mientras se
+# envía, si el despachador se cae vuelve a estar disponible al vencer
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "300"))
+
+# Estrategia para el total de las listas paginadas: exact, cached o estimated
+COUNT_MODE = os.getenv("COUNT_MODE", "exact")
+COUNT_CACHE_TTL = float(os.getenv("COUNT_CACHE_TTL", "30"))
+COUNT_CACHE_SIZE = int(os.getenv("COUNT_CACHE_SIZE", "2000"))
+# Bajo este número de filas estimadas se usa COUNT(*) exacto
+COUNT_ESTIMATE_THRESHOLD = int(os.getenv("COUNT_ESTIMATE_THRESHOLD", "10000"))
+
+# Segundos entre recálculos de los contadores del dashboard
+COUNTERS_RECONCILE_INTERVAL = float(os.getenv("COUNTERS_RECONCILE_INTERVAL", "3600"))
+
+# Zona horaria con la que se agrupan los días, semanas y meses del dashboard
+TIMESERIES_TIMEZONE = os.getenv("TIMESERIES_TIMEZONE", "America/Santiago")
+TIMESERIES_MAX_BUCKETS = int(os.getenv("TIMESERIES_MAX_BUCKETS", "366"))
+# Los períodos ya cerrados no cambian, solo se recalcula el actual
+TIMESERIES_CACHE_TTL = float(os.getenv("TIMESERIES_CACHE_TTL", "86400"))
+TIMESERIES_CACHE_SIZE = int(os.getenv("TIMESERIES_CACHE_SIZE", "20000"))
+
+# Carga masiva de casos
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "1000"))
+# Bytes del archivo que se mantienen en memoria antes de pasar a disco
+IMPORT_SPOOL_SIZE = int(os.getenv("IMPORT_SPOOL_SIZE", str(10 * 1024 * 1024)))
+
+# Filas leídas del cursor y escritas por bloque en la exportación
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "2000"))
+
+# Rango del calendario de planes de intervención
+CALENDAR_DEFAULT_DAYS = int(os.getenv("CALENDAR_DEFAULT_DAYS", "31"))
+CALENDAR_MAX_DAYS = int(os.getenv("CALENDAR_MAX_DAYS", "366"))
+CALENDAR_BATCH_SIZE = int(os.getenv("CALENDAR_BATCH_SIZE", "1000"))
+
+# Máximo de trabajadores por llamada a POST /social-cases/collect
+COLLECT_MAX_EMPLOYEES = int(os.getenv("COLLECT_MAX_EMPLOYEES", "1000"))
+
+# Detector de N+1: off, log (informa los requests que exceden su
+# presupuesto) o raise (falla en la sentencia que lo excede)
+QUERY_BUDGET_MODE = os.getenv("QUERY_BUDGET_MODE", "off")
+# Presupuesto por defecto de los endpoints que no declaran uno con QueryBudget
+QUERY_BUDGET_STATEMENTS = int(os.getenv("QUERY_BUDGET_STATEMENTS", "20"))
+QUERY_BUDGET_REPEATED = int(os.getenv("QUERY_BUDGET_REPEATED", "3"))
+
+# Zona horaria de los días en los filtros startDate/endDate de las listas
+FILTER_TIMEZONE = os.getenv("FILTER_TIMEZONE", TIMESERIES_TIMEZONE)
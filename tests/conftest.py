@@ -0,0 +1,108 @@
+import os
+import pytest
+
+# app.settings lee la configuración al importarse
+os.environ.setdefault("ENV", "testing")
+# Los endpoints de los tests deben respetar su presupuesto de consultas
+os.environ.setdefault("QUERY_BUDGET_MODE", "raise")
+os.environ.setdefault("DATABASE_URL_DEV", "postgresql://postgres@localhost:5432/social-case")
+for service in ("ASSISTANCE", "AUTH", "BENEFITS", "BUSINESS", "CESANTES", "CONSULTAS_WEB", "CURSOS",
+                "EMPLOYEE", "INCLUSION", "MIGRANTES", "PARAMETERS", "POLLS", "PROTOCOLS", "SCHEDULE",
+                "SCHOLARSHIP", "SOCIAL_CASE", "VIVIENDA"):
+    for prefix in ("DEV", "TEST"):
+        os.environ.setdefault("%s_SERVICE_%s" % (service, prefix), "http://services.test")
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+from app.main import app  # noqa: E402
+from app.database.main import engine  # noqa: E402
+from app.API.v1.middlewares import auth, query_budget  # noqa: E402
+
+USER_ID = 7
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+@pytest.fixture(scope="session")
+def database():
+    """
+    Engine de la base de pruebas, los tests que la usan se omiten si no
+    está disponible
+    """
+    try:
+        with engine.connect():
+            pass
+    except OperationalError:
+        pytest.skip("Base de datos no disponible")
+    return engine
+
+
+@pytest.fixture
+def auth_headers(monkeypatch):
+    async def authenticate(self, token):
+        return USER_ID
+
+    monkeypatch.setattr(auth.JWTBearer, "authenticate", authenticate)
+    return {"Authorization": "Bearer test"}
+
+
+@pytest.fixture
+def statements(database):
+    """
+    Registra las sentencias y los commits ejecutados durante el test
+    """
+    log = {"statements": [], "commits": 0}
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        log["statements"].append(statement)
+
+    def commit(conn):
+        log["commits"] += 1
+
+    event.listen(database, "before_cursor_execute", before_cursor_execute)
+    event.listen(database, "commit", commit)
+    yield log
+    event.remove(database, "before_cursor_execute", before_cursor_execute)
+    event.remove(database, "commit", commit)
+
+
+def get_index_names(plan: dict) -> list:
+    names = [plan["Index Name"]] if "Index Name" in plan else []
+    for child in plan.get("Plans", []):
+        names.extend(get_index_names(child))
+    return names
+
+
+@pytest.fixture
+def explain(database):
+    """
+    Retorna los índices que usa el plan de la consulta. Se desactiva el
+    seq scan para que el resultado no dependa del tamaño de la tabla de
+    pruebas, solo de si la condición puede usar el índice.
+    """
+    def run(query) -> set:
+        compiled = query.compile(dialect=database.dialect, compile_kwargs={"render_postcompile": True})
+        with database.connect() as conn:
+            with conn.begin():
+                conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+                plan = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) %s" % compiled, compiled.params).scalar()
+        return set(get_index_names(plan[0]["Plan"]))
+
+    return run
+
+
+@pytest.fixture
+def budget(monkeypatch):
+    """
+    Cuenta las sentencias del test con el presupuesto por defecto en modo
+    raise, para código que corre fuera de un request
+    """
+    monkeypatch.setattr(query_budget, "QUERY_BUDGET_MODE", "raise")
+    stats = query_budget.QueryStats()
+    token = query_budget.current_stats.set(stats)
+    yield stats
+    query_budget.current_stats.reset(token)
@@ -0,0 +1,37 @@
+import base64
+import json
+from app.API.v1.middlewares import auth
+
+
+def encode_segment(value: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip("=")
+
+
+# RS256 no se valida localmente, el token se verifica con /auth/me
+TOKEN = "%s.%s.c2lnbmF0dXJl" % (encode_segment({"alg": "RS256"}), encode_segment({"id": 7}))
+
+
+class AuthResponse:
+    status = 200
+    data = json.dumps({"id": 7}).encode()
+
+
+def test_auth_service_called_once_per_request(client, monkeypatch):
+    """
+    JWTBearer está en el router principal y en el del módulo, el usuario
+    se resuelve una sola vez por request
+    """
+    calls = []
+
+    def request(method, url, **kwargs):
+        calls.append(url)
+        return AuthResponse()
+
+    auth.token_cache.clear()
+    monkeypatch.setattr(auth.http, "request", request)
+
+    response = client.get("/api/v1/metrics", headers={"Authorization": "Bearer %s" % TOKEN})
+
+    assert response.status_code == 200
+    assert len(calls) == 1
+    assert calls[0].endswith("/auth/me")
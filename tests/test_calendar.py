@@ -0,0 +1,62 @@
+from datetime import datetime, timezone
+import pytest
+from app.API.v1.modules.intervention_plans.calendar import expand_occurrences
+
+
+def day(year: int, month: int, number: int) -> datetime:
+    return datetime(year, month, number, 9, tzinfo=timezone.utc)
+
+
+def occurrences(next_date: datetime, frequency: str, start: datetime, end: datetime) -> list:
+    return list(expand_occurrences(next_date, frequency, start, end))
+
+
+@pytest.mark.parametrize("frequency,expected", [
+    ("DIARIA", [day(2024, 3, number) for number in range(1, 11)]),
+    ("SEMANAL", [day(2024, 3, 1), day(2024, 3, 8)]),
+    ("QUINCENAL", [day(2024, 3, 1)]),
+])
+def test_day_steps(frequency, expected):
+    # next_date anterior al rango, las ocurrencias siguen el paso desde next_date
+    assert occurrences(day(2024, 2, 16), frequency, day(2024, 3, 1), day(2024, 3, 10)) == expected
+
+
+@pytest.mark.parametrize("frequency,expected", [
+    ("MENSUAL", [day(2024, month, 15) for month in range(1, 7)]),
+    ("BIMESTRAL", [day(2024, 1, 15), day(2024, 3, 15), day(2024, 5, 15)]),
+    ("TRIMESTRAL", [day(2024, 2, 15), day(2024, 5, 15)]),
+    ("SEMESTRAL", [day(2024, 5, 15)]),
+    ("ANUAL", []),
+])
+def test_month_steps(frequency, expected):
+    assert occurrences(day(2023, 11, 15), frequency, day(2024, 1, 1), day(2024, 6, 30)) == expected
+
+
+def test_month_end_is_clamped_without_drifting():
+    """
+    El 31 se recorta al último día de los meses cortos y vuelve al 31 en
+    los meses que lo tienen
+    """
+    assert occurrences(day(2023, 12, 31), "MENSUAL", day(2024, 1, 1), day(2024, 5, 31)) == [
+        day(2024, 1, 31), day(2024, 2, 29), day(2024, 3, 31), day(2024, 4, 30), day(2024, 5, 31)]
+    assert occurrences(day(2024, 2, 29), "ANUAL", day(2025, 1, 1), day(2028, 12, 31)) == [
+        day(2025, 2, 28), day(2026, 2, 28), day(2027, 2, 28), day(2028, 2, 29)]
+
+
+@pytest.mark.parametrize("frequency", ["DIARIA", "MENSUAL", "FECHA FIJA"])
+def test_window_edges_are_inclusive(frequency):
+    assert occurrences(day(2024, 3, 1), frequency, day(2024, 3, 1), day(2024, 3, 1)) == [day(2024, 3, 1)]
+
+
+@pytest.mark.parametrize("frequency", ["DIARIA", "SEMANAL", "MENSUAL", "FECHA FIJA"])
+def test_next_date_after_end(frequency):
+    assert occurrences(day(2024, 3, 2), frequency, day(2024, 2, 1), day(2024, 3, 1)) == []
+
+
+def test_one_off_before_start():
+    assert occurrences(day(2024, 2, 29), "FECHA FIJA", day(2024, 3, 1), day(2024, 3, 31)) == []
+
+
+def test_frequency_is_case_insensitive():
+    assert occurrences(day(2024, 3, 1), "semanal", day(2024, 3, 1), day(2024, 3, 15)) == [
+        day(2024, 3, 1), day(2024, 3, 8), day(2024, 3, 15)]
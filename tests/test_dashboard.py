@@ -0,0 +1,137 @@
+import asyncio
+import time
+from datetime import date, datetime, timezone
+import pytest
+from app.API.v1.modules.dashboard import services
+from app.API.v1.modules.dashboard.model import CaseStateCounter
+from app.API.v1.modules.social_cases.model import SocialCase
+from app.database.main import AsyncSessionLocal, SessionLocal, async_engine, engine
+
+BUSINESS_ID = 990200
+COUNTER_BUSINESS_ID = 990201
+
+# Bordes de los días 1 y 2 de marzo de 2024 en America/Santiago (UTC-3)
+CREATED_AT = [datetime(2024, 3, 1, 2, 59, 59, tzinfo=timezone.utc),
+              datetime(2024, 3, 1, 3, tzinfo=timezone.utc),
+              datetime(2024, 3, 3, 2, 59, 59, tzinfo=timezone.utc),
+              datetime(2024, 3, 3, 3, tzinfo=timezone.utc)]
+
+
+@pytest.fixture
+def local_timezone(monkeypatch):
+    """
+    Zona horaria del proceso distinta a la de las series, para que un
+    parámetro sin zona interpretado en hora del proceso mueva los bordes
+    """
+    monkeypatch.setenv("TZ", "Asia/Tokyo")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+@pytest.fixture
+def boundary_cases(database, monkeypatch):
+    monkeypatch.setattr(services, "TIMESERIES_TIMEZONE", "America/Santiago")
+    services.timeseries_cache.clear()
+    with SessionLocal() as db:
+        db.add_all([SocialCase(date=created_at, created_at=created_at, assistance_id=1, employee_rut="1-9",
+                               employee_id=BUSINESS_ID, employee_names="Trabajador de prueba",
+                               business_id=BUSINESS_ID, business_name="Empresa", state="ASIGNADO", area_id=1, professional_id=1,
+                               created_by=1) for created_at in CREATED_AT])
+        db.commit()
+    yield
+    services.timeseries_cache.clear()
+    with SessionLocal() as db:
+        db.query(SocialCase).filter(SocialCase.business_id == BUSINESS_ID).delete()
+        db.commit()
+
+
+def get_timeseries(*args):
+    async def run():
+        try:
+            async with AsyncSessionLocal() as db:
+                return await services.get_timeseries(db, *args)
+        finally:
+            await async_engine.dispose()
+
+    return asyncio.run(run())
+
+
+def test_timeseries_day_boundaries(boundary_cases, local_timezone):
+    items = get_timeseries("day", date(2024, 3, 1), date(2024, 3, 2), {"business_id": BUSINESS_ID})
+
+    assert [(item["bucket"], item["opened"]) for item in items] == [(date(2024, 3, 1), 1), (date(2024, 3, 2), 1)]
+
+
+def test_timeseries_caches_only_requested_buckets(boundary_cases, local_timezone, monkeypatch):
+    build_timeseries_query = services.build_timeseries_query
+
+    def wider_query(interval, start, end, filters):
+        return build_timeseries_query(interval, services.shift_bucket(start, interval, -1),
+                                      services.shift_bucket(end, interval), filters)
+
+    monkeypatch.setattr(services, "build_timeseries_query", wider_query)
+    items = get_timeseries("day", date(2024, 3, 1), date(2024, 3, 2), {"business_id": BUSINESS_ID})
+    key = ("day", (("business_id", BUSINESS_ID),))
+
+    assert [item["bucket"] for item in items] == [date(2024, 3, 1), date(2024, 3, 2)]
+    assert services.timeseries_cache.get(key + (datetime(2024, 3, 1),))["opened"] == 1
+    assert services.timeseries_cache.get(key + (datetime(2024, 2, 29),)) is None
+    assert services.timeseries_cache.get(key + (datetime(2024, 3, 3),)) is None
+
+
+def get_counters(db) -> dict:
+    return {row.state: row.count for row in db.query(CaseStateCounter).filter(
+        CaseStateCounter.business_id == COUNTER_BUSINESS_ID)}
+
+
+@pytest.fixture
+def counters(database):
+    def clean():
+        with SessionLocal() as db:
+            db.query(CaseStateCounter).filter(CaseStateCounter.business_id == COUNTER_BUSINESS_ID).delete()
+            db.commit()
+
+    clean()
+    yield
+    clean()
+
+
+def test_counter_deltas(counters):
+    with SessionLocal() as db:
+        social_case = SocialCase(business_id=COUNTER_BUSINESS_ID, area_id=1, state="SOLICITADO", is_active=True)
+        services.count_new_case(db, social_case)
+        services.set_case_state(db, social_case, "ASIGNADO")
+        services.set_case_state(db, social_case, "ASIGNADO")
+
+        assert get_counters(db) == {"SOLICITADO": 0, "ASIGNADO": 1}
+        assert social_case.state == "ASIGNADO"
+        db.rollback()
+
+
+def test_reconcile_fixes_drift(counters):
+    with SessionLocal() as db:
+        services.apply_counter_deltas(db, {(COUNTER_BUSINESS_ID, 1, "ASIGNADO"): 3})
+        db.commit()
+
+    assert services.reconcile_state_counters() == 1
+    assert services.reconcile_state_counters() == 0
+    with SessionLocal() as db:
+        assert get_counters(db) == {"ASIGNADO": 0}
+
+
+def test_reconcile_runs_once_at_a_time(counters):
+    with SessionLocal() as db:
+        services.apply_counter_deltas(db, {(COUNTER_BUSINESS_ID, 1, "ASIGNADO"): 3})
+        db.commit()
+
+    with engine.connect() as conn:
+        with conn.begin():
+            conn.execute("SELECT pg_advisory_lock(%s)" % services.COUNTERS_LOCK_ID)
+        assert services.reconcile_state_counters() == 0
+        with conn.begin():
+            conn.execute("SELECT pg_advisory_unlock(%s)" % services.COUNTERS_LOCK_ID)
+
+    with SessionLocal() as db:
+        assert get_counters(db) == {"ASIGNADO": 3}
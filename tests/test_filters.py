@@ -0,0 +1,56 @@
+from datetime import datetime
+from sqlalchemy.future import select
+from sqlalchemy.sql.functions import func
+from app.API.v1.helpers.filters import FilterSet
+from app.API.v1.modules.social_cases.model import SocialCase
+from app.API.v1.modules.social_cases.services import get_case_filters
+
+START = datetime(2024, 3, 1, 15, 30)
+END = datetime(2024, 3, 31, 8)
+
+
+def test_date_range_uses_index(explain):
+    condition = FilterSet().date_range(SocialCase.date, START, END).condition()
+
+    assert "ix_social_case_date" in explain(select(SocialCase.id).where(condition))
+
+
+def test_date_cast_does_not_use_index(explain):
+    """
+    Control del test anterior: la comparación sobre la columna
+    transformada no puede usar el índice
+    """
+    condition = func.date(SocialCase.date).between(START.date(), END.date())
+
+    assert "ix_social_case_date" not in explain(select(SocialCase.id).where(condition))
+
+
+def test_date_range_is_half_open_from_day_start():
+    condition = FilterSet().date_range(SocialCase.date, START, END).condition()
+    params = condition.compile().params
+
+    assert sorted(value for value in params.values() if isinstance(value, datetime)) == [
+        datetime(2024, 3, 1), datetime(2024, 4, 1)]
+    assert str(condition) == ("social_case.date >= timezone(:timezone_1, :timezone_2) "
+                              "AND social_case.date < timezone(:timezone_3, :timezone_4)")
+
+
+def test_case_filters_use_date_index(explain):
+    condition, _ = get_case_filters(business_id=None, start_date=START, end_date=END, state=None,
+                                    assistance_id=None, professional_id=None, area_id=None, search=None)
+
+    assert "ix_social_case_date" in explain(select(SocialCase.id).where(condition))
+
+
+def test_search_without_terms_is_skipped():
+    filters = FilterSet().search(SocialCase.search_vector, " -.!? ")
+
+    assert str(filters.condition()) == "true"
+    assert filters.rank is None
+
+
+def test_search_terms_are_prefixes():
+    filters = FilterSet().search(SocialCase.search_vector, "juan pér")
+
+    assert "juan:* & pér:*" in filters.condition().compile().params.values()
+    assert filters.rank is not None
@@ -0,0 +1,50 @@
+import pytest
+from sqlalchemy.future import select
+from sqlalchemy.sql.functions import func
+from app.API.v1.modules.intervention_plans.calendar import RECURRING_FREQUENCIES
+from app.API.v1.modules.intervention_plans.model import InterventionPlan
+from app.API.v1.modules.social_cases.model import SocialCase
+from app.API.v1.modules.social_cases.services import get_case_filters
+
+NO_FILTERS = {"business_id": None, "start_date": None, "end_date": None, "state": None,
+              "assistance_id": None, "professional_id": None, "area_id": None, "search": None}
+
+
+@pytest.mark.parametrize("filters,indexes", [
+    ({"business_id": 1}, {"ix_social_case_business_created_at", "ix_social_case_business_construction_created_at"}),
+    ({"area_id": 1}, {"ix_social_case_area_created_at"}),
+    ({"state": "ASIGNADO"}, {"ix_social_case_state_created_at"}),
+])
+def test_case_filter_uses_index(explain, filters, indexes):
+    condition, _ = get_case_filters(**{**NO_FILTERS, **filters})
+
+    assert explain(select(SocialCase.id).where(condition)) & indexes
+
+
+def test_professional_filter_uses_both_indexes(explain):
+    """
+    El OR entre el profesional responsable y los derivados se resuelve
+    con un BitmapOr de ambos índices
+    """
+    condition, _ = get_case_filters(**{**NO_FILTERS, "professional_id": 1})
+
+    assert {"ix_social_case_professional_created_at",
+            "ix_social_case_assistance_derivation_id"} <= explain(select(SocialCase.id).where(condition))
+
+
+def test_case_list_order_uses_index(explain):
+    query = select(SocialCase.id).order_by(SocialCase.created_at.desc()).limit(30)
+
+    assert "ix_social_case_created_at" in explain(query)
+
+
+@pytest.mark.parametrize("condition,index", [
+    (InterventionPlan.social_case_id == 1, "ix_intervention_plan_social_case_id"),
+    ((InterventionPlan.professional_id == 1) & (InterventionPlan.is_active == True),  # noqa: E712
+     "ix_intervention_plan_professional_next_date"),
+    # Rama recurrente de calendar_condition
+    (func.upper(InterventionPlan.frequency).in_(RECURRING_FREQUENCIES) & (InterventionPlan.is_active == True),  # noqa: E712
+     "ix_intervention_plan_recurring_next_date"),
+])
+def test_plan_filter_uses_index(explain, condition, index):
+    assert index in explain(select(InterventionPlan.id).where(condition))
@@ -0,0 +1,84 @@
+import pytest
+from fastapi.exceptions import HTTPException
+from app.API.v1.modules.social_cases import services
+from app.API.v1.modules.social_cases.model import EmployeeStatusOutbox
+from app.database.main import SessionLocal
+
+EMPLOYEE_IDS = [990300, 990301]
+
+
+def enqueue(employee_id: int, body: dict):
+    with SessionLocal() as db:
+        # Si el despachador tuviera la fila bloqueada el reemplazo esperaría
+        db.execute("SET LOCAL lock_timeout = '1s'")
+        services.enqueue_employee_status(db, employee_id, body)
+        db.commit()
+
+
+def get_events(employee_id: int) -> list:
+    with SessionLocal() as db:
+        return db.query(EmployeeStatusOutbox).filter(
+            EmployeeStatusOutbox.employee_id == employee_id).order_by(EmployeeStatusOutbox.id).all()
+
+
+@pytest.fixture
+def sent(database, monkeypatch):
+    def clean():
+        with SessionLocal() as db:
+            db.query(EmployeeStatusOutbox).filter(EmployeeStatusOutbox.employee_id.in_(EMPLOYEE_IDS)).delete(
+                synchronize_session=False)
+            db.commit()
+
+    sent = []
+    monkeypatch.setattr(services, "patch_employee_status",
+                        lambda token, employee_id, body: sent.append((employee_id, body)))
+    clean()
+    yield sent
+    clean()
+
+
+def test_new_status_waits_for_status_in_flight(sent, monkeypatch):
+    enqueue(EMPLOYEE_IDS[0], {"has_social_case": True})
+
+    def patch_employee_status(token, employee_id, body):
+        # Un cambio nuevo llega mientras se envía el anterior
+        enqueue(employee_id, {"has_social_case": False})
+        assert services.dispatch_employee_status("token", employee_ids=EMPLOYEE_IDS) == 0
+        sent.append((employee_id, body))
+
+    monkeypatch.setattr(services, "patch_employee_status", patch_employee_status)
+    assert services.dispatch_employee_status("token", employee_ids=EMPLOYEE_IDS) == 1
+
+    first, second = get_events(EMPLOYEE_IDS[0])
+    assert first.last_error == services.OUTBOX_SUPERSEDED and first.claimed_until is None
+    assert second.processed_at is None and second.attempts == 0
+
+    monkeypatch.undo()
+    monkeypatch.setattr(services, "patch_employee_status",
+                        lambda token, employee_id, body: sent.append((employee_id, body)))
+    assert services.dispatch_employee_status("token", employee_ids=EMPLOYEE_IDS) == 1
+    assert sent == [(EMPLOYEE_IDS[0], {"has_social_case": True}), (EMPLOYEE_IDS[0], {"has_social_case": False})]
+
+
+def test_dispatch_only_given_employees(sent):
+    for employee_id in EMPLOYEE_IDS:
+        enqueue(employee_id, {"has_social_case": True})
+
+    assert services.dispatch_employee_status("token", retries=False, employee_ids=EMPLOYEE_IDS[:1]) == 1
+    assert sent == [(EMPLOYEE_IDS[0], {"has_social_case": True})]
+    assert get_events(EMPLOYEE_IDS[1])[0].processed_at is None
+
+
+def test_failed_status_is_released_for_retry(sent, monkeypatch):
+    enqueue(EMPLOYEE_IDS[0], {"has_social_case": True})
+
+    def patch_employee_status(token, employee_id, body):
+        raise HTTPException(status_code=400, detail="Error al obtener datos")
+
+    monkeypatch.setattr(services, "patch_employee_status", patch_employee_status)
+    assert services.dispatch_employee_status("token", employee_ids=EMPLOYEE_IDS) == 1
+
+    event, = get_events(EMPLOYEE_IDS[0])
+    assert event.processed_at is None and event.claimed_until is None
+    assert event.attempts == 1 and event.last_error == "Error al obtener datos"
+    assert services.dispatch_employee_status("token", employee_ids=EMPLOYEE_IDS) == 0
@@ -0,0 +1,25 @@
+import pytest
+from app.API.v1.helpers.pagination import estimate_count, get_query_signature
+from app.API.v1.modules.social_cases.model import SocialCase
+from app.database.main import SessionLocal
+
+
+@pytest.fixture
+def db(database):
+    with SessionLocal() as db:
+        yield db
+
+
+def test_estimate_count_with_in_filter(db):
+    query = db.query(SocialCase.id).filter(SocialCase.id.in_([1, 2, 3]))
+
+    assert 0 <= estimate_count(query) <= 3
+
+
+def test_signature_depends_on_in_values(db):
+    def signature(ids: list) -> str:
+        return get_query_signature(db.query(SocialCase.id).filter(SocialCase.id.in_(ids)))
+
+    assert signature([1, 2]) == signature([1, 2])
+    assert signature([1, 2]) != signature([1, 3])
+    assert signature([1, 2]) != signature([1, 2, 3])
@@ -0,0 +1,37 @@
+import pytest
+from sqlalchemy.future import select
+from app.API.v1.middlewares.query_budget import QueryBudgetExceeded
+from app.API.v1.modules.social_cases.model import SocialCase
+from app.database.main import SessionLocal
+
+
+def test_detects_repeated_statement(database, budget):
+    """
+    Un N+1: la misma consulta por cada caso excede `QUERY_BUDGET_REPEATED`
+    en la sentencia que lo supera
+    """
+    with SessionLocal() as db:
+        ids = db.execute(select(SocialCase.id).limit(budget.max_repeated + 1)).scalars().all()
+        if len(ids) <= budget.max_repeated:
+            pytest.skip("No hay casos suficientes")
+
+        with pytest.raises(QueryBudgetExceeded, match="repetida %s veces" % (budget.max_repeated + 1)):
+            for id in ids:
+                db.execute(select(SocialCase).where(SocialCase.id == id)).scalar_one()
+
+    assert budget.statements == budget.max_repeated + 2
+
+
+def test_single_query_within_budget(database, budget):
+    with SessionLocal() as db:
+        db.execute(select(SocialCase).limit(budget.max_repeated + 1)).scalars().all()
+
+    assert budget.statements == 1
+
+
+def test_endpoint_reports_statements(client, auth_headers, database):
+    response = client.get("/api/v1/dashboard/stats", headers=auth_headers)
+
+    assert response.status_code == 200
+    assert response.headers["x-db-statements"] == "1"
+    assert float(response.headers["x-db-time"]) >= 0
@@ -0,0 +1,48 @@
+from types import SimpleNamespace
+import pytest
+from app.API.v1.helpers import fetch_data
+
+
+def get_request(user_id: int):
+    return SimpleNamespace(token="token-%s" % user_id, state=SimpleNamespace(auth=SimpleNamespace(user_id=user_id)))
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    calls = []
+
+    def fetch_service(token, route):
+        calls.append(token)
+        return {"route": route, "token": token}
+
+    monkeypatch.setattr(fetch_data, "fetch_service", fetch_service)
+    for cache in fetch_data.reference_caches.values():
+        cache.clear()
+    yield calls
+    for cache in fetch_data.reference_caches.values():
+        cache.clear()
+
+
+def test_user_scoped_cache(calls):
+    first = fetch_data.get_business_data(get_request(1), 10)
+
+    assert fetch_data.get_business_data(get_request(1), 10) == first
+    assert fetch_data.get_business_data(get_request(2), 10)["token"] == "token-2"
+    assert calls == ["token-1", "token-2"]
+
+
+def test_shared_cache(calls):
+    fetch_data.fetch_parameter_data(get_request(1), "areas", 10)
+    fetch_data.fetch_parameter_data(get_request(2), "areas", 10)
+
+    assert calls == ["token-1"]
+
+
+def test_invalidate_all_users(calls):
+    fetch_data.get_employee_data(get_request(1), 10)
+    fetch_data.get_employee_data(get_request(2), 10)
+    fetch_data.get_employee_data(get_request(2), 11)
+
+    fetch_data.invalidate_reference_data("employees", (10,))
+
+    assert fetch_data.reference_caches["employees"].stats()["size"] == 1
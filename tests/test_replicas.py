@@ -0,0 +1,94 @@
+import time
+from types import SimpleNamespace
+import pytest
+from app.database import main
+from app.database.replicas import LAG_QUERY, ReplicaSet
+
+REPLICA_URL = "postgresql://postgres@replica.test:5432/social-case"
+
+
+def get_request(user_id: int):
+    return SimpleNamespace(state=SimpleNamespace(auth=SimpleNamespace(user_id=user_id)))
+
+
+def get_bind(dependency, req):
+    db = next(dependency(req))
+    try:
+        return db.get_bind()
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def replicas(monkeypatch):
+    """
+    Réplica sana que nunca se conecta, el chequeo se simula
+    """
+    replicas = ReplicaSet([REPLICA_URL], max_lag=5, check_interval=10, sticky_seconds=60)
+    replica = replicas.replicas[0]
+    replica.healthy, replica.lag, replica.checked_at = True, 0.0, time.monotonic()
+    monkeypatch.setattr(main, "replicas", replicas)
+    return replicas
+
+
+def test_reads_use_replica(replicas):
+    assert get_bind(main.get_read_database, get_request(1)) is replicas.replicas[0].engine
+    assert replicas.as_dict()["replicaReads"] == 1
+
+
+def test_writes_use_primary(replicas):
+    assert get_bind(main.get_database, get_request(1)) is main.engine
+
+
+def test_reads_use_primary_without_healthy_replica(replicas):
+    replicas.replicas[0].checked_at -= replicas.check_interval * 3
+
+    assert get_bind(main.get_read_database, get_request(1)) is main.engine
+    assert replicas.as_dict()["primaryReads"] == 1
+
+
+def test_commit_pins_user_to_primary(replicas):
+    db = next(main.get_database(get_request(1)))
+    try:
+        db.commit()
+    finally:
+        db.close()
+
+    assert get_bind(main.get_read_database, get_request(1)) is main.engine
+    assert get_bind(main.get_read_database, get_request(2)) is replicas.replicas[0].engine
+
+
+class FakeEngine:
+    def __init__(self, lag):
+        self.lag = lag
+
+    def connect(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, query):
+        return SimpleNamespace(scalar=lambda: self.lag)
+
+
+@pytest.mark.parametrize("lag,healthy,error", [
+    (1.5, True, None),
+    (30, False, None),
+    (None, False, "WalReceiverNotStreaming"),
+])
+def test_check_replica_lag(replicas, lag, healthy, error):
+    replica = replicas.replicas[0]
+    replica.engine = FakeEngine(lag)
+
+    replicas.check(replica)
+
+    assert (replica.healthy, replica.lag, replica.error) == (healthy, lag, error)
+
+
+def test_lag_query_on_primary(database):
+    with database.connect() as conn:
+        assert conn.execute(LAG_QUERY).scalar() == 0
@@ -0,0 +1,46 @@
+import pytest
+from app.API.v1.modules.social_cases import routes
+
+CASE = {"date": "2022-01-01T00:00:00", "assistanceId": 1, "employeeRut": "1-9", "employeeId": 990100,
+        "employeeNames": "Trabajador de prueba", "businessId": 990100, "businessName": "Empresa",
+        "areaId": 1, "professionalId": 1, "requestType": "Prueba", "constructionId": 1,
+        "constructionName": "Obra"}
+
+
+@pytest.fixture
+def social_case(client, auth_headers, database, monkeypatch):
+    monkeypatch.setattr(routes, "dispatch_employee_status", lambda *args, **kwargs: 0)
+    response = client.post("/api/v1/social-cases", headers=auth_headers, json=CASE)
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_create_derivation_single_transaction(client, auth_headers, social_case, statements):
+    """
+    SELECT del caso, contadores, INSERT de la derivación y de sus
+    profesionales y UPDATE del caso en un solo commit, más la lectura de la
+    derivación para la respuesta
+    """
+    response = client.post("/api/v1/social-cases/%s/derivation" % social_case["id"], headers=auth_headers, json={
+        "date": "2022-01-02T00:00:00", "assistanceTitularId": 1, "observations": "Obs", "state": "ASIGNADO",
+        "priority": "A", "professionals": [{"userId": i, "fullName": "P%s" % i} for i in range(5)]})
+
+    assert response.status_code == 200
+    assert len(response.json()["professionals"]) == 5
+    assert statements["commits"] == 1
+    assert len(statements["statements"]) == 6
+
+
+def test_close_case_single_transaction(client, auth_headers, social_case, statements):
+    """
+    SELECT del caso, contadores, consulta de otros casos abiertos del
+    trabajador, outbox (reemplazo e INSERT), INSERT del cierre y UPDATE del
+    caso en un solo commit, más la lectura del cierre para la respuesta
+    """
+    response = client.post("/api/v1/social-cases/%s/close" % social_case["id"], headers=auth_headers, json={
+        "date": "2022-01-03T00:00:00", "state": "CERRADO", "professionalId": 1,
+        "professionalNames": "P", "observations": "Obs"})
+
+    assert response.status_code == 200
+    assert statements["commits"] == 1
+    assert len(statements["statements"]) == 8
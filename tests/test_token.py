@@ -0,0 +1,102 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import time
+import pytest
+from fastapi.exceptions import HTTPException
+from app.API.v1.middlewares import auth, token
+from app.API.v1.middlewares.token import InvalidToken, UnverifiableToken, decode_jwt
+
+SECRET = b"secret"
+
+
+def encode_segment(value) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip("=")
+
+
+def sign(header, payload, secret: bytes = SECRET) -> str:
+    signing_input = "%s.%s" % (encode_segment(header), encode_segment(payload))
+    signature = hmac.new(secret, signing_input.encode(), hashlib.sha256).digest()
+    return "%s.%s" % (signing_input, base64.urlsafe_b64encode(signature).decode().rstrip("="))
+
+
+@pytest.fixture(autouse=True)
+def keys(monkeypatch):
+    monkeypatch.setattr(token, "KEYS", {None: SECRET, "other": b"other-secret"})
+    monkeypatch.setattr(token, "JWT_ALGORITHMS", ["HS256"])
+    auth.token_cache.clear()
+    yield
+    auth.token_cache.clear()
+
+
+def test_valid_hmac_token():
+    payload = {"id": 7, "exp": time.time() + 60}
+
+    assert decode_jwt(sign({"alg": "HS256"}, payload)) == payload
+
+
+def test_kid_selects_key():
+    assert decode_jwt(sign({"alg": "HS256", "kid": "other"}, {"id": 7}, b"other-secret")) == {"id": 7}
+
+
+def test_expired_token():
+    with pytest.raises(InvalidToken):
+        decode_jwt(sign({"alg": "HS256"}, {"id": 7, "exp": time.time() - 1}))
+
+
+def test_tampered_signature():
+    header, payload, signature = sign({"alg": "HS256"}, {"id": 7}).split(".")
+
+    with pytest.raises(InvalidToken):
+        decode_jwt("%s.%s.%s" % (header, encode_segment({"id": 8}), signature))
+
+
+@pytest.mark.parametrize("header", [{"alg": "RS256"}, {"alg": "HS512"}, "x", []])
+def test_unverifiable_token(header):
+    with pytest.raises(UnverifiableToken):
+        decode_jwt(sign(header, {"id": 7}))
+
+
+def test_payload_must_be_an_object():
+    with pytest.raises(UnverifiableToken):
+        decode_jwt(sign({"alg": "HS256"}, [7]))
+
+
+def authenticate(jwt: str) -> int:
+    return asyncio.run(auth.JWTBearer().authenticate(jwt))
+
+
+def test_unverifiable_token_falls_back_to_auth_service(monkeypatch):
+    calls = []
+    monkeypatch.setattr(auth.JWTBearer, "verify_jwt", lambda self, jwt: calls.append(jwt) or 9)
+    jwt = sign({"alg": "RS256"}, {"id": 7})
+
+    assert authenticate(jwt) == 9
+    assert calls == [jwt]
+
+
+def test_non_object_header_falls_back_to_auth_service(monkeypatch):
+    monkeypatch.setattr(auth.JWTBearer, "verify_jwt", lambda self, jwt: 9)
+
+    assert authenticate(sign("x", "y")) == 9
+
+
+def test_invalid_token_is_rejected(monkeypatch):
+    monkeypatch.setattr(auth.JWTBearer, "verify_jwt", lambda self, jwt: pytest.fail("No debe consultar"))
+
+    with pytest.raises(HTTPException) as error:
+        authenticate(sign({"alg": "HS256"}, {"id": 7}, b"wrong"))
+    assert error.value.status_code == 403
+
+
+def test_token_cache_hit(monkeypatch):
+    calls = []
+    decode = token.decode_jwt
+    monkeypatch.setattr(auth, "decode_jwt", lambda jwt: calls.append(jwt) or decode(jwt))
+    jwt = sign({"alg": "HS256"}, {"id": 7, "exp": time.time() + 60})
+
+    assert authenticate(jwt) == 7
+    assert authenticate(jwt) == 7
+    assert calls == [jwt]